@@ -10,23 +10,54 @@ __license__ = "BSD"
 __copyright__ = "Copyright 2015-present, The osquery authors"
 __url__ = "https://osquery.io"
 
+import sys
+
 __all__ = [
+    "ADDITIONAL",
+    "ARRAY_COLUMNS",
+    "ASYNCIO_SERVER",
     "BasePlugin",
+    "BIGINT",
     "ConfigPlugin",
     "DEFAULT_SOCKET_PATH",
     "deregister_extension",
+    "DOUBLE",
+    "ENCODER_ACCELERATION",
+    "EQUALS",
     "ExtensionClient",
     "ExtensionManager",
+    "GLOB",
+    "GREATER_THAN",
+    "GREATER_THAN_OR_EQUALS",
+    "HIDDEN",
+    "INDEX",
     "INTEGER",
+    "LESS_THAN",
+    "LESS_THAN_OR_EQUALS",
+    "LazyRows",
+    "LIKE",
+    "LIST_COLUMNS",
     "LoggerPlugin",
+    "MATCH",
+    "NO_ACCELERATION",
+    "NUMPY_COLUMNS",
+    "OPTIMIZED",
     "parse_cli_params",
+    "PREFORK_SERVER",
+    "ProcessPoolTablePlugin",
+    "PROTOCOL_ACCELERATION",
+    "QueryContext",
+    "REGEXP",
     "register_plugin",
+    "REQUIRED",
     "start_extension",
     "Singleton",
     "SpawnInstance",
     "STRING",
     "TableColumn",
     "TablePlugin",
+    "thrift_acceleration",
+    "THREADS_SERVER",
     "WINDOWS_PLATFORM",
 ]
 
@@ -35,8 +66,22 @@ from osquery.extension_client import DEFAULT_SOCKET_PATH, ExtensionClient, \
     WINDOWS_PLATFORM
 from osquery.extension_manager import ExtensionManager
 from osquery.logger_plugin import LoggerPlugin
-from osquery.management import SpawnInstance, \
-    deregister_extension, parse_cli_params, register_plugin, start_extension
+from osquery.management import ASYNCIO_SERVER, PREFORK_SERVER, \
+    THREADS_SERVER, SpawnInstance, deregister_extension, parse_cli_params, \
+    register_plugin, start_extension
 from osquery.plugin import BasePlugin
+from osquery.process_pool_plugin import ProcessPoolTablePlugin
+from osquery.protocol import ENCODER_ACCELERATION, NO_ACCELERATION, \
+    PROTOCOL_ACCELERATION, thrift_acceleration
+from osquery.query_context import EQUALS, GLOB, GREATER_THAN, \
+    GREATER_THAN_OR_EQUALS, LESS_THAN, LESS_THAN_OR_EQUALS, LIKE, MATCH, \
+    QueryContext, REGEXP
+from osquery.query_result import ARRAY_COLUMNS, LIST_COLUMNS, \
+    NUMPY_COLUMNS, LazyRows
 from osquery.singleton import Singleton
-from osquery.table_plugin import INTEGER, STRING, TableColumn, TablePlugin
+from osquery.table_plugin import ADDITIONAL, BIGINT, DOUBLE, HIDDEN, INDEX, \
+    INTEGER, OPTIMIZED, REQUIRED, STRING, TableColumn, TablePlugin
+
+if sys.version_info >= (3, 5):
+    __all__ += ["AsyncLoggerPlugin", "AsyncTablePlugin"]
+    from osquery.async_plugin import AsyncLoggerPlugin, AsyncTablePlugin
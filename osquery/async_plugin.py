@@ -0,0 +1,191 @@
+"""This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+# pylint: disable=no-self-use
+# pylint: disable=unused-argument
+
+import asyncio
+from abc import abstractmethod
+
+from osquery.extensions.ttypes import ExtensionResponse, ExtensionStatus
+from osquery.logger_plugin import LoggerPlugin
+from osquery.table_plugin import TablePlugin
+
+
+def run_coroutine(coro):
+    """Run a coroutine to completion on a private event loop.
+
+    This is used when an asynchronous plugin is called by one of the
+    threaded servers, which do not run an event loop.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class AsyncTablePlugin(TablePlugin):
+    """Table plugins with an asynchronous generate should inherit from
+    AsyncTablePlugin
+
+    When the extension is started with the asyncio server, generate is
+    awaited on the server's event loop, so many I/O bound requests can be
+    in flight without a thread each.
+    """
+
+    def call(self, context):
+        """Internal routing for this plugin type.
+
+        Do not override this method.
+        """
+        return run_coroutine(self.call_async(context))
+
+    async def call_async(self, context):
+        """Asynchronous internal routing for this plugin type.
+
+        Do not override this method.
+        """
+        if context.get("action") != "generate":
+            return TablePlugin.call(self, context)
+        ctx = self._parse_context(context)
+        key, response = self._cache_lookup(ctx)
+        if response is None:
+            response = self._cache_store(key,
+                                         await self._generate_async(ctx),
+                                         ctx)
+        return response
+
+    def _generate_uncached(self, context):
+        """Generate and convert the response for a query context."""
+        return run_coroutine(self._generate_async(context))
+
+    async def _generate_async(self, context):
+        """Await generate and convert its response."""
+        contexts = self._fanout_contexts(context)
+        if contexts is not None:
+            limit = asyncio.Semaphore(self.fanout_workers)
+
+            async def generate_value(value_context):
+                async with limit:
+                    return await self._generate_async(value_context)
+            return self._merge_responses(await asyncio.gather(
+                *[generate_value(ctx) for ctx in contexts]))
+        rows = self.generate(context)
+        if hasattr(rows, "__aiter__"):
+            # Rows are converted and counted against the budget as they
+            # arrive, like the rows of a synchronous generator.
+            builder = self._response_builder(context)
+            timed = context.deadline() is not None
+            while True:
+                try:
+                    if timed:
+                        # A generator stalled between rows is cancelled at
+                        # the deadline.
+                        row = await asyncio.wait_for(rows.__anext__(),
+                                                     context.remaining())
+                    else:
+                        row = await rows.__anext__()
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    await rows.aclose()
+                    return self._deadline_response(None, builder.response)
+                if context.cancelled():
+                    await rows.aclose()
+                    return self._deadline_response(None, builder.response)
+                message = builder.add(row)
+                if message is not None:
+                    await rows.aclose()
+                    return self._builder_response(None, builder, message)
+            return ExtensionResponse(
+                status=ExtensionStatus(code=0, message="OK",),
+                response=builder.response)
+        try:
+            rows = await asyncio.wait_for(rows, context.remaining())
+        except asyncio.TimeoutError:
+            return self._deadline_response(None, [])
+        return self._generate_response(rows, context)
+
+    @abstractmethod
+    async def generate(self, context):
+        """The asynchronous implementation of your table plugin.
+
+        This coroutine should return a list of dictionaries, just like
+        osquery.TablePlugin.generate. It may also be an asynchronous
+        generator yielding each dictionary.
+
+        Consider the following example:
+
+            class MyTablePlugin(osquery.AsyncTablePlugin):
+                async def generate(self, context):
+                    reader, writer = await asyncio.open_connection(
+                        "localhost", 8080)
+                    ...
+                    return [{"foo": "bar", "baz": "boo"}]
+
+        This must be implemented by your plugin.
+        """
+        raise NotImplementedError
+
+
+class AsyncLoggerPlugin(LoggerPlugin):
+    """Logger plugins with asynchronous logging methods should inherit from
+    AsyncLoggerPlugin"""
+
+    def call(self, context):
+        """Internal routing for this plugin type.
+
+        Do not override this method.
+        """
+        return run_coroutine(self.call_async(context))
+
+    async def call_async(self, context):
+        """Asynchronous internal routing for this plugin type.
+
+        Do not override this method.
+        """
+        if "string" in context:
+            status = await self.log_string(context["string"])
+        elif "snapshot" in context:
+            status = await self.log_snapshot(context["snapshot"])
+        elif "health" in context:
+            status = await self.log_health(context["health"])
+        else:
+            return LoggerPlugin.call(self, context)
+        return ExtensionResponse(status=status, response=[],)
+
+    @abstractmethod
+    async def log_string(self, value):
+        """The asynchronous implementation of your logger plugin.
+
+        This must be implemented by your plugin.
+
+        This must return an ExtensionStatus
+
+        Arguments:
+        value -- the string to log
+        """
+        raise NotImplementedError
+
+    async def log_health(self, value):
+        """If you'd like the log health statistics about osquery's performance,
+        override this method in your logger plugin.
+
+        By default, this action is a noop.
+
+        This must return an ExtensionStatus
+        """
+        return ExtensionStatus(code=0, message="OK",)
+
+    async def log_snapshot(self, value):
+        """If you'd like to log snapshot queries in a special way, override
+        this method.
+
+        By default, this action is just hands off the string to log_string.
+
+        This must return an ExtensionStatus
+        """
+        return await self.log_string(value)
@@ -0,0 +1,280 @@
+"""This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+import asyncio
+import logging
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+from thrift.Thrift import TApplicationException, TMessageType, TType
+from thrift.protocol import TBinaryProtocol
+from thrift.transport import TTransport
+
+from osquery.extension_manager import coalesce_key
+from osquery.extensions.Extension import call_args, call_result
+from osquery.response import write_call_result
+
+
+class TAsyncioServer(object):
+    """An asyncio server speaking the binary thrift protocol
+
+    Every connection from osquery core is served by a coroutine on a single
+    event loop. Asynchronous plugins, such as osquery.AsyncTablePlugin, are
+    awaited on that loop. Other plugins are called on a thread pool so they
+    cannot block the loop.
+    """
+
+    _read_size = 65536
+
+    def __init__(self, processor, transport, workers=None):
+        """
+        Keyword arguments:
+        processor -- the ExtensionProcessor wrapping the ExtensionManager
+        transport -- an unopened TServerSocket to listen on
+        workers -- the maximum number of threads calling synchronous plugins
+        """
+        self.processor = processor
+        self.transport = transport
+        self.workers = workers
+        self._executor = None
+        self._in_flight = {}
+
+    def serve(self):
+        """Listen on the server transport and serve requests forever"""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        self.transport.listen()
+        sock = self.transport.handle
+        sock.setblocking(False)
+        loop.run_until_complete(
+            asyncio.start_unix_server(self._handle_connection, sock=sock))
+        try:
+            loop.run_forever()
+        finally:
+            self._executor.shutdown(wait=False)
+            loop.close()
+
+    async def _handle_connection(self, reader, writer):
+        """Read thrift messages from a connection and write their replies"""
+        buff = bytearray()
+        scanner = _MessageScanner()
+        try:
+            while True:
+                data = await reader.read(self._read_size)
+                if not data:
+                    break
+                buff.extend(data)
+                while buff:
+                    size = scanner.scan(buff)
+                    if size is None:
+                        break
+                    raw = bytes(buff[:size])
+                    del buff[:size]
+                    scanner.reset()
+                    writer.write(await self._process(
+                        *self._decode_message(raw)))
+                    await writer.drain()
+        except (ConnectionError, TTransport.TTransportException):
+            pass
+        except Exception as e:  # pylint: disable=broad-except
+            logging.exception(e)
+        finally:
+            writer.close()
+
+    def _decode_message(self, raw):
+        """Decode a complete message.
+
+        Returns the raw message, the method name, the sequence id, and the
+        decoded call arguments.
+        """
+        iprot = TBinaryProtocol.TBinaryProtocol(TTransport.TMemoryBuffer(raw))
+        args = None
+        (name, _, seqid) = iprot.readMessageBegin()
+        if name == "call":
+            args = call_args()
+            args.read(iprot)
+        return raw, name, seqid, args
+
+    async def _process(self, raw, name, seqid, args):
+        """Process a single message and return the encoded reply"""
+        otrans = TTransport.TMemoryBuffer()
+        oprot = TBinaryProtocol.TBinaryProtocol(otrans)
+        if name != "call":
+            # Pings, shutdown requests and unknown methods are cheap and
+            # are answered by the generated processor.
+            itrans = TTransport.TMemoryBuffer(raw)
+            self.processor.process(
+                TBinaryProtocol.TBinaryProtocol(itrans), oprot)
+            return otrans.getvalue()
+
+        result = call_result()
+        try:
+            result.success = await self._call(
+                args.registry, args.item, args.request)
+            msg_type = TMessageType.REPLY
+        except Exception as ex:  # pylint: disable=broad-except
+            msg_type = TMessageType.EXCEPTION
+            logging.exception(ex)
+            result = TApplicationException(
+                TApplicationException.INTERNAL_ERROR, 'Internal error')
+        oprot.writeMessageBegin("call", msg_type, seqid)
+        write_call_result(oprot, result)
+        oprot.writeMessageEnd()
+        return otrans.getvalue()
+
+    async def _call(self, registry, item, request):
+        """Route a call to an asynchronous plugin or the thread pool"""
+        # pylint: disable=protected-access
+        manager = self.processor._handler
+        plugin = manager.plugin(registry, item)
+        if plugin is None or not hasattr(plugin, "call_async"):
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(
+                self._executor, manager.call, registry, item, request)
+
+        # Identical table requests share the in flight call, just like the
+        # ExtensionManager does for synchronous plugins.
+        key = coalesce_key(registry, item, request)
+        if key is None:
+            return await plugin.call_async(request)
+        if key in self._in_flight:
+            return await asyncio.shield(self._in_flight[key])
+        future = asyncio.ensure_future(plugin.call_async(request))
+        self._in_flight[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+
+_I32 = struct.Struct(">i").unpack_from
+
+# The encoded size of fixed width thrift types.
+_FIXED_SIZES = {
+    TType.BOOL: 1,
+    TType.BYTE: 1,
+    TType.I16: 2,
+    TType.I32: 4,
+    TType.I64: 8,
+    TType.DOUBLE: 8,
+}
+
+# The kinds of pending scanner frames.
+_VALUE = 0
+_FIELDS = 1
+_ELEMENTS = 2
+
+
+class _MessageScanner(object):
+    """Finds where a binary protocol message ends as its bytes arrive
+
+    Nothing is decoded, the scan only follows the lengths of the message's
+    values. It resumes where it stopped when more bytes arrive, so a message
+    read in many chunks is scanned once.
+    """
+
+    def __init__(self):
+        self.pos = 0
+        self._stack = None
+
+    def reset(self):
+        """Scan the next message from the start of the buffer."""
+        self.pos = 0
+        self._stack = None
+
+    def scan(self, buff):
+        """Return the size of the message starting the buffer, or None if the
+        buffer does not yet hold all of it."""
+        if self._stack is None:
+            header = _header_size(buff)
+            if header is None:
+                return None
+            self.pos = header
+            self._stack = [[_FIELDS]]
+        pos = self.pos
+        stack = self._stack
+        size = len(buff)
+        while stack:
+            frame = stack[-1]
+            if frame[0] == _FIELDS:
+                if pos >= size:
+                    break
+                if buff[pos] == TType.STOP:
+                    pos += 1
+                    stack.pop()
+                    continue
+                if pos + 3 > size:
+                    break
+                stack.append([_VALUE, buff[pos]])
+                pos += 3
+            elif frame[0] == _ELEMENTS:
+                types, remaining = frame[1], frame[2]
+                if not remaining:
+                    stack.pop()
+                    continue
+                frame[2] -= 1
+                stack.append([_VALUE, types[remaining % len(types)]])
+            else:
+                ttype = frame[1]
+                if ttype in _FIXED_SIZES:
+                    if pos + _FIXED_SIZES[ttype] > size:
+                        break
+                    pos += _FIXED_SIZES[ttype]
+                    stack.pop()
+                elif ttype == TType.STRING:
+                    if pos + 4 > size or pos + 4 + _size(buff, pos) > size:
+                        break
+                    pos += 4 + _size(buff, pos)
+                    stack.pop()
+                elif ttype == TType.STRUCT:
+                    stack[-1] = [_FIELDS]
+                elif ttype == TType.MAP:
+                    if pos + 6 > size:
+                        break
+                    # Keys and values alternate, the remaining count picks
+                    # the type of the next one.
+                    stack[-1] = [_ELEMENTS, (buff[pos], buff[pos + 1]),
+                                 2 * _size(buff, pos + 2)]
+                    pos += 6
+                elif ttype in (TType.LIST, TType.SET):
+                    if pos + 5 > size:
+                        break
+                    stack[-1] = [_ELEMENTS, (buff[pos],),
+                                 _size(buff, pos + 1)]
+                    pos += 5
+                else:
+                    raise TTransport.TTransportException(
+                        TTransport.TTransportException.UNKNOWN,
+                        "Unknown thrift type %d" % ttype)
+        self.pos = pos
+        return None if stack else pos
+
+
+def _size(buff, pos):
+    """Read a string length or collection size, which must not be negative"""
+    size = _I32(buff, pos)[0]
+    if size < 0:
+        raise TTransport.TTransportException(
+            TTransport.TTransportException.NEGATIVE_SIZE,
+            "Negative length: %d" % size)
+    return size
+
+
+def _header_size(buff):
+    """The size of the message header starting the buffer, or None"""
+    if len(buff) < 4:
+        return None
+    first = _I32(buff, 0)[0]
+    if first < 0:
+        # Strict messages start with the version and type, then the name.
+        if len(buff) < 8:
+            return None
+        header = 8 + _size(buff, 4) + 4
+    else:
+        # Old messages start with the name, then the type byte.
+        header = 4 + first + 1 + 4
+    return header if len(buff) >= header else None
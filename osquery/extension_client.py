@@ -11,11 +11,15 @@ from __future__ import unicode_literals
 import time
 import sys
 
-from thrift.protocol import TBinaryProtocol
 from thrift.transport import TSocket
 from thrift.transport import TTransport
 
 from osquery.extensions.ExtensionManager import Client
+from osquery.extensions.ttypes import ExtensionResponse
+from osquery.protocol import binary_protocol
+from osquery.query_result import LIST_COLUMNS, columnar_rows, \
+    read_query_reply
+from osquery.transport import TLargeBufferedTransport
 
 WINDOWS_PLATFORM = "win32"
 
@@ -33,11 +37,14 @@ class ExtensionClient(object):
     _protocol = None
     _transport = None
 
-    def __init__(self, path=DEFAULT_SOCKET_PATH, uuid=None):
+    def __init__(self, path=DEFAULT_SOCKET_PATH, uuid=None,
+                 buffer_size=TLargeBufferedTransport.MAX_BUFFER):
         """
         Keyword arguments:
         path -- the path of the extension socket to connect to
         uuid -- the additional UUID to use when constructing the socket path
+        buffer_size -- the size the socket's read buffer may grow to for
+            large query results, 0 uses thrift's TBufferedTransport
         """
         self.path = path
         sock = None
@@ -46,8 +53,13 @@ class ExtensionClient(object):
         else:
             self.path += ".{}".format(uuid) if uuid else ""
             sock = TSocket.TSocket(unix_socket=self.path)
-        self._transport = TTransport.TBufferedTransport(sock)
-        self._protocol = TBinaryProtocol.TBinaryProtocol(self._transport)
+        if sys.platform == WINDOWS_PLATFORM or not buffer_size:
+            self._transport = TTransport.TBufferedTransport(sock)
+        else:
+            self._transport = TLargeBufferedTransport(
+                sock, min(TLargeBufferedTransport.DEFAULT_BUFFER, buffer_size),
+                buffer_size)
+        self._protocol = binary_protocol(self._transport)
 
     def close(self):
         """Close the extension client connection"""
@@ -74,3 +86,32 @@ class ExtensionClient(object):
     def extension_client(self):
         """Return an extension (osquery extension) client."""
         return Client(self._protocol)
+
+    def lazy_query(self, sql):
+        """Run a query, decoding the rows as they are accessed.
+
+        Returns an ExtensionResponse like extension_manager_client().query,
+        whose response is an osquery.LazyRows sequence over the raw reply.
+        """
+        self.extension_manager_client().send_query(sql)
+        return read_query_reply(self._protocol)
+
+    def columnar_query(self, sql, container=LIST_COLUMNS):
+        """Run a query, decoding its result into one sequence per column.
+
+        The column types are taken from osquery core's getQueryColumns, so
+        numeric columns arrive as numbers. Returns an ExtensionResponse whose
+        response is the columns, see osquery.query_result.columnar_rows for
+        the containers. A failed query's response is empty.
+        """
+        client = self.extension_manager_client()
+        columns = client.getQueryColumns(sql)
+        if columns.status.code != 0:
+            return ExtensionResponse(status=columns.status, response=[])
+        result = self.lazy_query(sql)
+        if result.status.code != 0:
+            return ExtensionResponse(status=result.status, response=[])
+        types = [column for row in columns.response for column in row.items()]
+        return ExtensionResponse(
+            status=result.status,
+            response=columnar_rows(result.response, types, container))
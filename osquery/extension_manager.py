@@ -21,6 +21,24 @@ def shutdown_request(code, timeout=1):
     time.sleep(timeout)
     os._exit(code)
 
+def coalesce_key(registry, item, request):
+    """The key identifying identical requests that may share one response.
+
+    Only table generate requests are coalesced, every logger request must
+    reach its plugin. Returns None for requests that cannot be coalesced.
+    """
+    if registry != "table" or request.get("action") != "generate":
+        return None
+    return registry, item, tuple(sorted(request.items()))
+
+class InFlightCall(object):
+    """A plugin call other callers with an identical request wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
 class ExtensionManager(Singleton, Iface):
     """The thrift server for handling extension requests
 
@@ -31,6 +49,8 @@ class ExtensionManager(Singleton, Iface):
     """
     _plugins = {}
     _registry = {}
+    _in_flight = {}
+    _in_flight_lock = threading.Lock()
 
     uuid = None
 
@@ -80,6 +100,13 @@ class ExtensionManager(Singleton, Iface):
         """Accessor for the internal _registry member variable"""
         return self._registry
 
+    def plugin(self, registry, item):
+        """Accessor for a registered plugin instance
+
+        Returns None if the registry does not contain the requested plugin.
+        """
+        return self._plugins.get(registry, {}).get(item)
+
     def ping(self):
         """Lightweight health verification
 
@@ -116,9 +143,40 @@ class ExtensionManager(Singleton, Iface):
                 response=[],)
 
         try:
-            return self._plugins[registry][item].call(request)
+            key = coalesce_key(registry, item, request)
+            if key is None:
+                return self._plugins[registry][item].call(request)
+            return self._call_coalesced(key, registry, item, request)
         except KeyError:
             message = "Extension registry does not contain requested plugin"
             return ExtensionResponse(
                 status=ExtensionStatus(code=1, message=message,),
                 response=[],)
+
+    def _call_coalesced(self, key, registry, item, request):
+        """Call a plugin once for concurrent identical requests
+
+        The first caller generates the response, callers arriving while it
+        is in flight wait and share its response instead of generating the
+        same rows again.
+        """
+        with self._in_flight_lock:
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = InFlightCall()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.response
+        try:
+            flight.response = self._plugins[registry][item].call(request)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._in_flight_lock:
+                del self._in_flight[key]
+            flight.done.set()
+        return flight.response
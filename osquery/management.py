@@ -10,6 +10,7 @@ from __future__ import unicode_literals
 
 import argparse
 import logging
+import multiprocessing
 import os
 import random
 import socket
@@ -28,15 +29,18 @@ except ImportError:
             pass
     logging.NullHandler = NullHandler
 
-from thrift.protocol import TBinaryProtocol
 from thrift.server import TServer
 from thrift.transport import TSocket
 from thrift.transport import TTransport
 
 from osquery.extensions.ttypes import ExtensionException, InternalExtensionInfo
-from osquery.extensions.Extension import Processor
 from osquery.extension_client import ExtensionClient, DEFAULT_SOCKET_PATH, WINDOWS_PLATFORM
 from osquery.extension_manager import ExtensionManager
+from osquery.prefork_server import TPreforkServer
+from osquery.processor import ExtensionProcessor
+from osquery.protocol import protocol_factory, thrift_acceleration
+from osquery.transport import TLargeBufferedTransport, \
+    TLargeBufferedTransportFactory
 
 if sys.platform == WINDOWS_PLATFORM:
     # We bootleg our own version of Windows pipe coms
@@ -52,6 +56,17 @@ if sys.platform == WINDOWS_PLATFORM:
 DARWIN_BINARY_PATH = "/usr/local/bin/osqueryd"
 LINUX_BINARY_PATH = "/usr/bin/osqueryd"
 
+THREADS_SERVER = "threads"
+"""Serve requests with a simple server, or a thread pool for many workers"""
+
+ASYNCIO_SERVER = "asyncio"
+"""Serve requests on an asyncio event loop"""
+
+PREFORK_SERVER = "prefork"
+"""Serve requests from forked worker processes sharing one socket"""
+
+SERVER_MODES = [THREADS_SERVER, ASYNCIO_SERVER, PREFORK_SERVER]
+
 class SpawnInstance(object):
     """Spawn a standalone osquery instance"""
     """The osquery process instance."""
@@ -181,6 +196,17 @@ def parse_cli_params():
         type=int,
         default=1,
         help="Seconds delay between connectivity checks")
+    parser.add_argument(
+        "--server",
+        type=str,
+        choices=SERVER_MODES,
+        default=None,
+        help="The kind of server fielding extension requests")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of threads serving extension requests concurrently")
     parser.add_argument(
         "--verbose",
         action="store_true",
@@ -214,7 +240,10 @@ def start_watcher(client, interval):
 def start_extension(name="<unknown>",
                     version="0.0.0",
                     sdk_version="3.0.7",
-                    min_sdk_version="1.8.0"):
+                    min_sdk_version="1.8.0",
+                    workers=None,
+                    server=THREADS_SERVER,
+                    buffer_size=TLargeBufferedTransport.MAX_BUFFER):
     """Start your extension by communicating with osquery core and starting
     a thrift server.
 
@@ -223,8 +252,34 @@ def start_extension(name="<unknown>",
     version -- the version of your extension
     sdk_version -- the version of the osquery SDK used to build this extension
     min_sdk_version -- the minimum version of the osquery SDK that you can use
+    workers -- the number of threads serving requests from osquery core, a
+        value greater than 1 lets independent plugin calls run concurrently.
+        A single thread by default. The --workers command line flag overrides
+        this value.
+    server -- the kind of server fielding requests, one of SERVER_MODES.
+        The asyncio server awaits asynchronous plugins on an event loop and
+        calls other plugins using up to workers threads. The prefork server
+        forks workers processes, one per CPU by default, that share the
+        extension socket. The --server command line flag overrides this value.
+    buffer_size -- the size the extension socket's read buffer may grow to
+        for large requests, 0 uses thrift's TBufferedTransport.
     """
     args = parse_cli_params()
+    if args.workers is not None:
+        workers = args.workers
+    if args.server is not None:
+        server = args.server
+    if server == ASYNCIO_SERVER and (sys.platform == WINDOWS_PLATFORM or
+                                     sys.version_info < (3, 5)):
+        raise ExtensionException(
+            code=1,
+            message="The asyncio server requires UNIX sockets and Python 3.5",
+        )
+    if server == PREFORK_SERVER and sys.platform == WINDOWS_PLATFORM:
+        raise ExtensionException(
+            code=1,
+            message="The prefork server is not supported on Windows",
+        )
 
     # Disable logging for the thrift module (can be loud).
     logging.getLogger('thrift').addHandler(logging.NullHandler())
@@ -273,7 +328,7 @@ def start_extension(name="<unknown>",
     # start a thrift server listening at the path dictated by the uuid returned
     # by the osquery core extension manager
     ext_manager.uuid = status.uuid
-    processor = Processor(ext_manager)
+    processor = ExtensionProcessor(ext_manager)
 
     transport = None
     if sys.platform == 'win32':
@@ -282,12 +337,54 @@ def start_extension(name="<unknown>",
         transport = TSocket.TServerSocket(
             unix_socket=args.socket + "." + str(status.uuid))
 
-    tfactory = TTransport.TBufferedTransportFactory()
-    pfactory = TBinaryProtocol.TBinaryProtocolFactory()
-    server = TServer.TSimpleServer(processor, transport, tfactory, pfactory)
+    if sys.platform == 'win32' or not buffer_size:
+        tfactory = TTransport.TBufferedTransportFactory()
+    else:
+        tfactory = TLargeBufferedTransportFactory(
+            min(TLargeBufferedTransport.DEFAULT_BUFFER, buffer_size),
+            buffer_size)
+    pfactory = protocol_factory()
+    logging.info("Extension %s thrift acceleration: %s", name,
+                 thrift_acceleration())
+    server = create_server(processor, transport, tfactory, pfactory, workers,
+                           server)
     server.serve()
 
 
+def create_server(processor, transport, tfactory, pfactory, workers=None,
+                  mode=THREADS_SERVER):
+    """Create the thrift server used to field extension requests.
+
+    A single worker uses a simple server that handles one connection at a
+    time. More workers use a thread pool, so a slow plugin call does not
+    hold up requests for other plugins. Plugins served by a thread pool must
+    be safe to call from multiple threads.
+
+    A prefork server binds the transport once and forks workers processes,
+    each serving requests from the shared listener.
+
+    Keyword arguments:
+    workers -- the number of threads, or processes, serving requests. One
+        thread, or one process per CPU for the prefork server, by default.
+    mode -- the kind of server, see SERVER_MODES
+    """
+    if mode == ASYNCIO_SERVER:
+        from osquery.asyncio_server import TAsyncioServer
+        return TAsyncioServer(processor, transport,
+                              1 if workers is None else workers)
+    if mode == PREFORK_SERVER:
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        return TPreforkServer(processor, transport, tfactory, pfactory,
+                              processes=workers)
+    if workers is None or workers <= 1:
+        return TServer.TSimpleServer(processor, transport, tfactory, pfactory)
+    server = TServer.TThreadPoolServer(
+        processor, transport, tfactory, pfactory, daemon=True)
+    server.setNumThreads(workers)
+    return server
+
+
 def deregister_extension():
     """Deregister the entire extension from the core extension manager"""
     args = parse_cli_params()
@@ -0,0 +1,142 @@
+"""This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import errno
+import logging
+import os
+import signal
+import threading
+import time
+
+from thrift.server import TServer
+from thrift.transport.TTransport import TServerTransportBase
+
+
+class TInheritedServerTransport(TServerTransportBase):
+    """A server transport wrapping a socket that is already listening
+
+    Worker processes accept connections on the listener bound by their
+    parent, they must not bind a new socket to the same path.
+    """
+
+    def __init__(self, transport):
+        self._transport = transport
+
+    def listen(self):
+        pass
+
+    def accept(self):
+        return self._transport.accept()
+
+    def close(self):
+        self._transport.close()
+
+
+def watch_parent(ppid, interval=1):
+    """Exit a worker process once the parent that forked it has exited."""
+    while True:
+        if os.getppid() != ppid:
+            os._exit(1)
+        time.sleep(interval)
+
+
+class TPreforkServer(TServer.TServer):
+    """A server forking worker processes that share one listening socket
+
+    The parent process binds the listener, forks the workers and supervises
+    them. Every worker inherits the registered plugins and accepts
+    connections on the shared listener, so CPU bound plugins scale with the
+    number of cores. Workers that crash are restarted, a worker that exits
+    cleanly (osquery core requested a shutdown) stops the whole server.
+    """
+
+    def __init__(self, processor, transport, tfactory, pfactory, processes=2,
+                 threads=1, restart_delay=1):
+        """
+        Keyword arguments:
+        processes -- the number of worker processes to fork
+        threads -- the number of threads serving requests in each worker
+        restart_delay -- seconds to wait before restarting a crashed worker
+        """
+        TServer.TServer.__init__(self, processor, transport, tfactory,
+                                 pfactory)
+        self.processes = processes
+        self.threads = threads
+        self.restart_delay = restart_delay
+        self.children = set()
+        self._running = False
+
+    def serve(self):
+        """Fork the workers and supervise them until shutdown"""
+        self.serverTransport.listen()
+        self._running = True
+        try:
+            for _ in range(self.processes):
+                self._spawn()
+            while self._running and self.children:
+                try:
+                    pid, status = os.waitpid(-1, 0)
+                except OSError as e:
+                    if e.errno == errno.EINTR:
+                        continue
+                    raise
+                if pid not in self.children:
+                    continue
+                self.children.discard(pid)
+                if os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0:
+                    logging.info("Worker %d exited, stopping server", pid)
+                    break
+                if not self._running:
+                    break
+                logging.error("Worker %d exited with status %d, restarting",
+                              pid, status)
+                time.sleep(self.restart_delay)
+                self._spawn()
+        finally:
+            self.stop()
+
+    def stop(self):
+        """Stop supervising and terminate the worker processes"""
+        self._running = False
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+            self.children.discard(pid)
+
+    def _spawn(self):
+        """Fork a worker process serving the shared listener"""
+        ppid = os.getpid()
+        pid = os.fork()
+        if pid != 0:
+            self.children.add(pid)
+            return
+        try:
+            rt = threading.Thread(target=watch_parent, args=(ppid,))
+            rt.daemon = True
+            rt.start()
+            self._server().serve()
+        except Exception as e:  # pylint: disable=broad-except
+            logging.exception(e)
+        finally:
+            os._exit(1)
+
+    def _server(self):
+        """The server run by each worker process"""
+        args = (self.processor,
+                TInheritedServerTransport(self.serverTransport),
+                self.inputTransportFactory,
+                self.inputProtocolFactory)
+        if self.threads <= 1:
+            return TServer.TSimpleServer(*args)
+        server = TServer.TThreadPoolServer(*args, daemon=True)
+        server.setNumThreads(self.threads)
+        return server
@@ -0,0 +1,195 @@
+"""This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from builtins import str
+import json
+import logging
+import multiprocessing
+import os
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+import sys
+import threading
+
+from osquery.extensions.ttypes import ExtensionResponse, ExtensionStatus
+from osquery.query_context import QueryContext
+from osquery.response import EncodedExtensionResponse, encode_response
+from osquery.table_plugin import TablePlugin
+
+# Seconds a worker has past the table deadline to return its partial rows
+# before it is killed.
+_DEADLINE_GRACE = 1
+
+# The status a worker sends before each encoded response.
+_OK = b"0"
+_RETIRING = b"1"
+_FAILED = b"2"
+
+
+class ProcessPoolTablePlugin(TablePlugin):
+    """Table plugins with a CPU bound generate should inherit from
+    ProcessPoolTablePlugin
+
+    generate runs in a pool of forked worker processes, so it neither holds
+    the extension's GIL nor stalls pings and other plugins. The query context
+    is sent to a worker as JSON and the rows come back as the encoded thrift
+    response, which is written to osquery core without being decoded.
+
+    The pool is started when the plugin is registered. A worker whose
+    resident memory exceeds pool_max_rss after a request is replaced, a
+    worker still generating past the table deadline is killed.
+    Platforms without fork generate in the extension process.
+    """
+
+    pool_processes = 2
+    """The number of worker processes"""
+
+    pool_max_rss = None
+    """Bytes of resident memory after which a worker is replaced"""
+
+    _pool = None
+    _pool_pid = None
+    _pool_lock = threading.Lock()
+
+    def __init__(self):
+        TablePlugin.__init__(self)
+        self.start_pool()
+
+    def start_pool(self):
+        """Start the worker processes if this process has none."""
+        if sys.platform == "win32" or self._pool_pid == os.getpid():
+            return
+        with self._pool_lock:
+            if self._pool_pid == os.getpid():
+                return
+            # A forked server process must not share its parent's workers.
+            pool = Queue()
+            for _ in range(self.pool_processes):
+                pool.put(_Worker(self))
+            self._pool = pool
+            self._pool_pid = os.getpid()
+
+    def stop_pool(self):
+        """Stop the worker processes, they are started again on demand."""
+        with self._pool_lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                return
+            for _ in range(self.pool_processes):
+                self._pool.get().stop()
+            self._pool = None
+            self._pool_pid = None
+
+    def _generate_uncached(self, context):
+        """Generate and convert the response in a worker process."""
+        if sys.platform == "win32" or self._fanout_contexts(context):
+            return TablePlugin._generate_uncached(self, context)
+        self.start_pool()
+        pool = self._pool
+        worker = pool.get()
+        try:
+            worker.conn.send_bytes(json.dumps(context).encode("utf-8"))
+            remaining = context.remaining()
+            if remaining is not None and \
+                    not worker.conn.poll(remaining + _DEADLINE_GRACE):
+                # The worker is killed so no one runs the abandoned generate.
+                worker.process.terminate()
+                worker.stop()
+                pool.put(_Worker(self))
+                return self._deadline_response(None, [])
+            status = worker.conn.recv_bytes()
+            payload = worker.conn.recv_bytes()
+        except (EOFError, IOError, OSError) as e:
+            logging.error("Table %s worker exited: %s" % (self.name(),
+                                                          str(e)))
+            worker.stop()
+            pool.put(_Worker(self))
+            return ExtensionResponse(
+                status=ExtensionStatus(code=1, message="Worker exited",),
+                response=[],)
+        if status == _RETIRING:
+            worker.stop()
+            worker = _Worker(self)
+        pool.put(worker)
+        if status == _FAILED:
+            return ExtensionResponse(
+                status=ExtensionStatus(code=1,
+                                       message=payload.decode("utf-8"),),
+                response=[],)
+        return EncodedExtensionResponse(payload)
+
+
+class _Worker(object):
+    """A worker process and the pipe it receives query contexts on"""
+
+    def __init__(self, plugin):
+        if hasattr(multiprocessing, "get_context"):
+            ctx = multiprocessing.get_context("fork")
+        else:
+            ctx = multiprocessing
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_serve, args=(plugin, child))
+        self.process.daemon = True
+        self.process.start()
+        child.close()
+
+    def stop(self):
+        """Stop the worker process."""
+        # Other workers inherit this pipe when they are forked, so the
+        # worker is asked to exit rather than waiting for the pipe to close.
+        try:
+            self.conn.send_bytes(b"")
+        except (IOError, OSError):
+            pass
+        self.conn.close()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+
+def _serve(plugin, conn):
+    """Generate the responses for the query contexts sent by the extension"""
+    while True:
+        try:
+            request = conn.recv_bytes()
+        except (EOFError, IOError, OSError):
+            return
+        if not request:
+            return
+        context = plugin._start_deadline(  # pylint: disable=protected-access
+            QueryContext(json.loads(request.decode("utf-8"))))
+        try:
+            payload = encode_response(TablePlugin._generate_uncached(
+                plugin, context))
+        except Exception as e:  # pylint: disable=broad-except
+            logging.exception(e)
+            conn.send_bytes(_FAILED)
+            conn.send_bytes(str(e).encode("utf-8"))
+            continue
+        retiring = plugin.pool_max_rss is not None and \
+            _rss() > plugin.pool_max_rss
+        conn.send_bytes(_RETIRING if retiring else _OK)
+        conn.send_bytes(payload)
+        if retiring:
+            return
+
+
+def _rss():
+    """The resident memory of this process in bytes"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (IOError, OSError):
+        import resource
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # The peak resident memory is reported in kilobytes, except on macOS.
+        return usage if sys.platform == "darwin" else usage * 1024
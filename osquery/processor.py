@@ -0,0 +1,52 @@
+"""This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import logging
+
+from thrift.Thrift import TApplicationException, TMessageType
+from thrift.transport import TTransport
+
+from osquery.extensions.Extension import Processor, call_args, call_result
+from osquery.response import write_call_result
+
+
+class ExtensionProcessor(Processor):
+    """The thrift processor for requests sent to the extension
+
+    It extends the generated processor so that responses which are already
+    encoded, such as cached table responses, are written without being
+    decoded and encoded again.
+    """
+
+    def __init__(self, handler):
+        Processor.__init__(self, handler)
+        self._processMap["call"] = ExtensionProcessor.process_call
+
+    def process_call(self, seqid, iprot, oprot):
+        args = call_args()
+        args.read(iprot)
+        iprot.readMessageEnd()
+        result = call_result()
+        try:
+            result.success = self._handler.call(args.registry, args.item,
+                                                args.request)
+            msg_type = TMessageType.REPLY
+        except (TTransport.TTransportException, KeyboardInterrupt,
+                SystemExit):
+            raise
+        except Exception as ex:  # pylint: disable=broad-except
+            msg_type = TMessageType.EXCEPTION
+            logging.exception(ex)
+            result = TApplicationException(
+                TApplicationException.INTERNAL_ERROR, 'Internal error')
+        oprot.writeMessageBegin("call", msg_type, seqid)
+        write_call_result(oprot, result)
+        oprot.writeMessageEnd()
+        oprot.trans.flush()
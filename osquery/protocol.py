@@ -0,0 +1,131 @@
+"""This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from thrift.Thrift import TType
+from thrift.protocol import TBinaryProtocol
+from thrift.transport import TTransport
+
+try:
+    from thrift.protocol import fastbinary
+except ImportError:
+    fastbinary = None
+
+from osquery.extensions.ttypes import ExtensionResponse, ExtensionStatus
+
+PROTOCOL_ACCELERATION = "protocol"
+"""Every thrift struct is encoded and decoded by thrift's C extension"""
+
+ENCODER_ACCELERATION = "encoder"
+"""Table responses are encoded by thrift's C extension"""
+
+NO_ACCELERATION = "python"
+"""Thrift structs are encoded and decoded in Python"""
+
+# A response exercising every field, encoded by each candidate to check it
+# produces the same bytes as the generated Python code.
+_SAMPLE = ExtensionResponse(
+    status=ExtensionStatus(code=0, message="OK", uuid=1),
+    response=[{"name": "value", "caf\u00e9": ""}, {}])
+
+
+def _python_encoding(response):
+    """Encode a response with the generated code and the Python protocol"""
+    trans = TTransport.TMemoryBuffer()
+    response.write(TBinaryProtocol.TBinaryProtocol(trans))
+    return trans.getvalue()
+
+
+def _probe_protocol():
+    """Check if the generated code works with the accelerated protocol.
+
+    The C extension of recent thrift releases expects struct specs in a
+    format the generated code predates, every struct then fails to encode.
+    """
+    try:
+        trans = TTransport.TMemoryBuffer()
+        oprot = TBinaryProtocol.TBinaryProtocolAccelerated(trans)
+        if getattr(oprot, "_fast_encode", None) is None:
+            return False
+        _SAMPLE.write(oprot)
+        decoded = ExtensionResponse()
+        decoded.read(TBinaryProtocol.TBinaryProtocolAccelerated(
+            TTransport.TMemoryBuffer(trans.getvalue())))
+    except Exception:  # pylint: disable=broad-except
+        return False
+    return decoded == _SAMPLE and \
+        trans.getvalue() == _python_encoding(_SAMPLE)
+
+
+def _list_spec(spec):
+    """Convert a struct spec to the format of recent thrift releases"""
+    converted = [None]
+    for field in spec[1:]:
+        if field is not None and field[1] == TType.STRUCT:
+            cls, struct_spec = field[3]
+            field = field[:3] + ([cls, _list_spec(struct_spec)],) + field[4:]
+        converted.append(field)
+    return tuple(converted)
+
+
+def _probe_encoder():
+    """Find the spec thrift's C extension encodes ExtensionResponse with"""
+    if fastbinary is None:
+        return None
+    expected = _python_encoding(_SAMPLE)
+    thrift_spec = ExtensionResponse.thrift_spec
+    for spec in ((ExtensionResponse, thrift_spec),
+                 [ExtensionResponse, _list_spec(thrift_spec)]):
+        try:
+            if fastbinary.encode_binary(_SAMPLE, spec) == expected:
+                return spec
+        except Exception:  # pylint: disable=broad-except
+            continue
+    return None
+
+
+_ACCELERATED_PROTOCOL = _probe_protocol()
+_RESPONSE_SPEC = _probe_encoder()
+
+
+def thrift_acceleration():
+    """Which thrift encoding path the extension uses.
+
+    Returns PROTOCOL_ACCELERATION if thrift's C extension works with the
+    generated code, ENCODER_ACCELERATION if it only encodes table responses
+    and NO_ACCELERATION if it is not installed.
+    """
+    if _ACCELERATED_PROTOCOL:
+        return PROTOCOL_ACCELERATION
+    if _RESPONSE_SPEC is not None:
+        return ENCODER_ACCELERATION
+    return NO_ACCELERATION
+
+
+def protocol_factory():
+    """The fastest binary protocol factory that works with the generated code
+    """
+    if _ACCELERATED_PROTOCOL:
+        return TBinaryProtocol.TBinaryProtocolAcceleratedFactory()
+    return TBinaryProtocol.TBinaryProtocolFactory()
+
+
+def binary_protocol(trans):
+    """The fastest binary protocol that works with the generated code"""
+    return protocol_factory().getProtocol(trans)
+
+
+def response_encoder():
+    """thrift's C encoder of ExtensionResponse structs, None if it cannot be
+    used"""
+    if _RESPONSE_SPEC is None:
+        return None
+    spec = _RESPONSE_SPEC
+    encode = fastbinary.encode_binary
+    return lambda response: encode(response, spec)
@@ -0,0 +1,373 @@
+"""This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from builtins import str
+import re
+import threading
+import time
+
+EQUALS = 2
+"""The = constraint operator, an IN list is sent as several EQUALS"""
+
+GREATER_THAN = 4
+"""The > constraint operator"""
+
+LESS_THAN_OR_EQUALS = 8
+"""The <= constraint operator"""
+
+LESS_THAN = 16
+"""The < constraint operator"""
+
+GREATER_THAN_OR_EQUALS = 32
+"""The >= constraint operator"""
+
+MATCH = 64
+"""The MATCH constraint operator"""
+
+LIKE = 65
+"""The LIKE constraint operator"""
+
+GLOB = 66
+"""The GLOB constraint operator"""
+
+REGEXP = 67
+"""The REGEXP constraint operator"""
+
+_AFFINITY_TYPES = {
+    "INTEGER": int,
+    "BIGINT": int,
+    "UNSIGNED BIGINT": int,
+    "DOUBLE": float,
+}
+
+# The affinities whose comparisons row_filter reproduces.
+_FILTERED_AFFINITIES = frozenset(["TEXT"]) | frozenset(_AFFINITY_TYPES)
+
+
+class QueryContext(dict):
+    """The query context osquery core sends along with a generate request
+
+    The context is the decoded JSON dictionary, so plugins that inspect it
+    directly keep working. The constraints osquery core pushed down from the
+    query's WHERE clause are also available through typed accessors, which
+    lets a plugin generate only the rows that can match:
+
+        def generate(self, context):
+            pids = context.equals("pid")
+            if pids is None:
+                pids = all_pids()
+            return [process_row(pid) for pid in pids]
+
+    osquery core still applies every constraint to the returned rows, so
+    generating a superset of the matching rows is always correct.
+
+    A table with a deadline cancels the context when the deadline passes.
+    Long running plugins should stop generating rows once cancelled returns
+    True, no one will read them.
+    """
+
+    def __init__(self, context=None):
+        dict.__init__(self, context or {})
+        self._columns_used = None
+        if "colsUsed" in self:
+            self._columns_used = frozenset(self["colsUsed"])
+        self._deadline = None
+        self._cancel = threading.Event()
+        self._constraints = {}
+        self._casts = {}
+        self._affinities = {}
+        for constraint in self.get("constraints", []):
+            cast = _AFFINITY_TYPES.get(constraint.get("affinity"))
+            self._casts[constraint["name"]] = cast
+            self._affinities[constraint["name"]] = constraint.get("affinity")
+            self._constraints.setdefault(constraint["name"], []).extend(
+                (int(item["op"]), _cast(cast, item["expr"]))
+                for item in constraint.get("list", []))
+
+    def columns_used(self):
+        """The set of column names the query uses.
+
+        Returns None if osquery core did not send the used columns, in which
+        case every column must be generated.
+        """
+        return self._columns_used
+
+    def is_column_used(self, column):
+        """Check if a column is used by the query.
+
+        Plugins may skip computing expensive columns, such as hashes, that
+        the query does not select or constrain.
+        """
+        return self._columns_used is None or column in self._columns_used
+
+    def constrained_columns(self):
+        """The names of the columns with at least one constraint"""
+        return [name for name, items in self._constraints.items() if items]
+
+    def constraints_for(self, column, op=None):
+        """The constraints on a column.
+
+        Expressions are converted to the column's type, integers for INTEGER,
+        BIGINT and UNSIGNED BIGINT columns, floats for DOUBLE columns and strings otherwise.
+
+        Keyword arguments:
+        column -- the name of the constrained column
+        op -- only return the expressions of this operator, such as EQUALS.
+            Without an operator a list of (operator, expression) is returned.
+        """
+        items = self._constraints.get(column, [])
+        if op is None:
+            return list(items)
+        return [expr for item_op, expr in items if item_op == op]
+
+    def equals(self, column):
+        """The set of values a column is constrained to by = or IN.
+
+        Returns None if the column has no equality constraint.
+        """
+        values = self.constraints_for(column, EQUALS)
+        if not values:
+            return None
+        return set(values)
+
+    def bounds(self, column):
+        """The (lower, upper) bounds of a column's range constraints.
+
+        Either bound is None if the column is not constrained on that side.
+        Bounds are inclusive, a plugin may return rows at a strict bound and
+        let osquery core filter them.
+        """
+        lower = upper = None
+        for op, expr in self.constraints_for(column):
+            try:
+                if op in (GREATER_THAN, GREATER_THAN_OR_EQUALS):
+                    if lower is None or expr > lower:
+                        lower = expr
+                elif op in (LESS_THAN, LESS_THAN_OR_EQUALS):
+                    if upper is None or expr < upper:
+                        upper = expr
+            except TypeError:
+                # An expression that could not be converted to the column
+                # type cannot be compared, osquery core will filter it.
+                continue
+        return lower, upper
+
+    def set_deadline(self, seconds):
+        """Cancel the context seconds from now."""
+        self._deadline = time.time() + seconds
+
+    def deadline(self):
+        """The time at which the context is cancelled, or None"""
+        return self._deadline
+
+    def remaining(self):
+        """The seconds left until the deadline, or None without a deadline"""
+        if self._deadline is None:
+            return None
+        return max(0, self._deadline - time.time())
+
+    def cancel(self):
+        """Cancel the context, generate should stop producing rows."""
+        self._cancel.set()
+
+    def cancelled(self):
+        """Check if the context was cancelled or its deadline passed."""
+        return self._cancel.is_set() or (self._deadline is not None and
+                                         time.time() >= self._deadline)
+
+    def split(self, column):
+        """One query context for each value of a column's = or IN constraint.
+
+        Every context keeps the other constraints. Returns a single context
+        equal to this one if the column has less than two values.
+        """
+        exprs = []
+        for constraint in self.get("constraints", []):
+            if constraint["name"] != column:
+                continue
+            for item in constraint.get("list", []):
+                if int(item["op"]) == EQUALS and item["expr"] not in exprs:
+                    exprs.append(item["expr"])
+        if len(exprs) < 2:
+            return [self]
+        contexts = []
+        for expr in exprs:
+            context = dict(self)
+            context["constraints"] = []
+            for constraint in self.get("constraints", []):
+                if constraint["name"] == column:
+                    constraint = dict(constraint)
+                    constraint["list"] = [
+                        item for item in constraint.get("list", [])
+                        if int(item["op"]) != EQUALS
+                    ] + [{"op": EQUALS, "expr": expr}]
+                context["constraints"].append(constraint)
+            context = QueryContext(context)
+            # Cancelling this context cancels every value's context.
+            # pylint: disable=protected-access
+            context._deadline = self._deadline
+            context._cancel = self._cancel
+            contexts.append(context)
+        return contexts
+
+    def cast(self, column, value):
+        """Convert a row value to the type of a constrained column.
+
+        Values that cannot be converted are returned as text.
+        """
+        return _cast(self._casts.get(column) or str, value)
+
+    def implies(self, other):
+        """Check if every row matching this context matches another context.
+
+        Only =, IN and range constraints are compared, any other constraint
+        of the other context must also be a constraint of this context.
+        """
+        # pylint: disable=protected-access
+        for column, items in other._constraints.items():
+            if items and not self._implies_column(column, items):
+                return False
+        return True
+
+    def _implies_column(self, column, items):
+        """Check if this context's constraints on a column imply items."""
+        mine = self._constraints.get(column, [])
+        values = self.equals(column)
+        allowed = set(expr for op, expr in items if op == EQUALS)
+        if allowed and (values is None or not values <= allowed):
+            return False
+        for op, expr in items:
+            if op == EQUALS or (op, expr) in mine:
+                continue
+            if op not in _COMPARISONS:
+                return False
+            if values is not None:
+                if not all(_compare(op, value, expr) for value in values):
+                    return False
+            elif not any(_narrower(my_op, my_expr, op, expr)
+                         for my_op, my_expr in mine):
+                return False
+        return True
+
+    def row_filter(self, columns=None):
+        """A function testing if a row can match the constraints.
+
+        Only =, IN, range and LIKE constraints on TEXT, INTEGER, BIGINT,
+        UNSIGNED BIGINT and DOUBLE columns are tested. A row is kept whenever
+        a value cannot be converted to the column type, osquery core filters
+        it exactly. Returns None if no constraint can be tested.
+
+        Keyword arguments:
+        columns -- only test the constraints on these columns
+        """
+        tests = []
+        for column, items in self._constraints.items():
+            if columns is not None and column not in columns:
+                continue
+            if self._affinities.get(column) not in _FILTERED_AFFINITIES:
+                # Other affinities may not compare like text.
+                continue
+            cast = self._casts.get(column) or str
+            values = self.equals(column)
+            if values is not None and not all(isinstance(value, cast)
+                                              for value in values):
+                # SQLite may still find an unconverted expression equal,
+                # such as 5.0 for an INTEGER column.
+                values = None
+            comparisons = [(op, expr) for op, expr in items
+                           if op in _COMPARISONS and isinstance(expr, cast)]
+            patterns = [_like(expr) for op, expr in items
+                        if op == LIKE and isinstance(expr, str)]
+            patterns = [pattern for pattern in patterns if pattern is not None]
+            if values is not None or comparisons or patterns:
+                tests.append((column, cast, values, comparisons, patterns))
+        if not tests:
+            return None
+
+        def matches(row):
+            for column, cast, values, comparisons, patterns in tests:
+                value = _row_value(cast, row.get(column))
+                if value is None:
+                    continue
+                if values is not None and value not in values:
+                    return False
+                for op, expr in comparisons:
+                    if not _COMPARISONS[op](value, expr):
+                        return False
+                for pattern in patterns:
+                    if isinstance(value, str) and not pattern.match(value):
+                        return False
+            return True
+        return matches
+
+
+_COMPARISONS = {
+    GREATER_THAN: lambda value, expr: value > expr,
+    GREATER_THAN_OR_EQUALS: lambda value, expr: value >= expr,
+    LESS_THAN: lambda value, expr: value < expr,
+    LESS_THAN_OR_EQUALS: lambda value, expr: value <= expr,
+}
+
+_LOWER_BOUNDS = (GREATER_THAN, GREATER_THAN_OR_EQUALS)
+_UPPER_BOUNDS = (LESS_THAN, LESS_THAN_OR_EQUALS)
+_STRICT_BOUNDS = (GREATER_THAN, LESS_THAN)
+
+
+def _compare(op, value, expr):
+    """Compare a value to an expression, values of other types never match"""
+    try:
+        return _COMPARISONS[op](value, expr)
+    except TypeError:
+        return False
+
+
+def _narrower(op, expr, other_op, other_expr):
+    """Check if the range constraint op expr implies other_op other_expr"""
+    for bounds in (_LOWER_BOUNDS, _UPPER_BOUNDS):
+        if op in bounds and other_op in bounds:
+            if expr == other_expr:
+                return op in _STRICT_BOUNDS or other_op not in _STRICT_BOUNDS
+            return _compare(other_op, expr, other_expr)
+    return False
+
+
+def _row_value(cast, value):
+    """Convert a row value to a column type, None if it cannot be compared"""
+    if value is None or isinstance(value, cast):
+        return value
+    if cast is str:
+        # Values of text columns are sent as their text.
+        return str(value)
+    if isinstance(value, str):
+        value = _cast(cast, value)
+        if isinstance(value, cast):
+            return value
+    return None
+
+
+def _like(pattern):
+    """Compile a LIKE pattern, None if it may not match like SQLite"""
+    if any(ord(char) > 127 for char in pattern):
+        # SQLite only folds the case of ASCII characters.
+        return None
+    regex = "".join(".*" if char == "%" else "." if char == "_"
+                    else re.escape(char) for char in pattern)
+    return re.compile(regex + r"\Z",
+                      re.IGNORECASE | re.DOTALL | getattr(re, "ASCII", 0))
+
+
+def _cast(cast, expr):
+    """Convert a constraint expression, leaving it as text on failure"""
+    if cast is None:
+        return expr
+    try:
+        return cast(expr)
+    except (TypeError, ValueError):
+        return expr
@@ -0,0 +1,425 @@
+"""This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from array import array
+from collections import OrderedDict
+try:
+    from collections.abc import Sequence
+except ImportError:
+    from collections import Sequence
+import struct
+import sys
+
+from thrift.Thrift import TApplicationException, TMessageType, TType
+from thrift.protocol import TBinaryProtocol
+from thrift.transport import TTransport
+
+from osquery.extensions.ttypes import ExtensionResponse, ExtensionStatus
+from osquery.table_plugin import BIGINT, DOUBLE, INTEGER
+
+LIST_COLUMNS = "list"
+"""Columns are lists, NULL values are None"""
+
+ARRAY_COLUMNS = "array"
+"""Numeric columns are array.array, NULL integers and integers out of the
+column type's range are 0 and NULL doubles NaN"""
+
+NUMPY_COLUMNS = "numpy"
+"""Columns are the fields of a NumPy structured array, NULL values are filled
+as for ARRAY_COLUMNS"""
+
+COLUMN_CONTAINERS = [LIST_COLUMNS, ARRAY_COLUMNS, NUMPY_COLUMNS]
+
+_I32 = struct.Struct(">i").unpack_from
+_FIELD = struct.Struct(">bh").unpack_from
+_COLLECTION = struct.Struct(">bi").unpack_from
+_MAP = struct.Struct(">bbi").unpack_from
+
+# The minimum number of bytes read from the transport at a time.
+_READ_SIZE = 65536
+
+# The type osquery core reports for unsigned 64-bit integer columns.
+_UNSIGNED_BIGINT = "UNSIGNED BIGINT"
+
+# int and float parse the raw UTF-8 values without decoding them, Python 2
+# needs them as str.
+if sys.version_info[0] < 3:
+    _INT = lambda raw: int(bytes(raw))
+    _FLOAT = lambda raw: float(bytes(raw))
+else:
+    _INT = int
+    _FLOAT = float
+
+
+def _typecode(code, fallback):
+    """An array typecode, or its fallback where Python lacks it"""
+    try:
+        array(str(code))
+        return str(code)
+    except ValueError:
+        return str(fallback)
+
+
+# The parser, array typecode, NumPy dtype and NULL fill of numeric columns.
+_NUMERIC_TYPES = {
+    INTEGER: (_INT, _typecode("q", "l"), "i8", 0),
+    BIGINT: (_INT, _typecode("q", "l"), "i8", 0),
+    _UNSIGNED_BIGINT: (_INT, _typecode("Q", "L"), "u8", 0),
+    DOUBLE: (_FLOAT, str("d"), "f8", float("nan")),
+}
+
+# The encoded size of fixed width thrift types.
+_FIXED_SIZES = {
+    TType.BOOL: 1,
+    TType.BYTE: 1,
+    TType.I16: 2,
+    TType.I32: 4,
+    TType.I64: 8,
+    TType.DOUBLE: 8,
+}
+
+
+class _Reply(object):
+    """The raw bytes of a reply, read from a transport as they are scanned"""
+
+    def __init__(self, trans):
+        self.trans = trans
+        self.buff = bytearray()
+
+    def need(self, end):
+        """Read until the buffer holds at least end bytes."""
+        buff = self.buff
+        while len(buff) < end:
+            # The client is synchronous, nothing follows the reply to be read
+            # by mistake.
+            chunk = self.trans.read(max(end - len(buff), _READ_SIZE))
+            if not chunk:
+                raise TTransport.TTransportException(
+                    TTransport.TTransportException.END_OF_FILE,
+                    "End of file reading the reply")
+            buff += chunk
+
+    def skip(self, pos, ttype):
+        """Return the offset following a value of a thrift type."""
+        if ttype in _FIXED_SIZES:
+            return pos + _FIXED_SIZES[ttype]
+        if ttype == TType.STRING:
+            self.need(pos + 4)
+            return pos + 4 + _size(_I32(self.buff, pos)[0])
+        if ttype == TType.STRUCT:
+            return self.fields(pos, {})
+        if ttype == TType.MAP:
+            self.need(pos + 6)
+            ktype, vtype, size = _MAP(self.buff, pos)
+            _size(size)
+            pos += 6
+            for _ in range(size):
+                pos = self.skip(pos, ktype)
+                pos = self.skip(pos, vtype)
+            return pos
+        if ttype in (TType.LIST, TType.SET):
+            self.need(pos + 5)
+            etype, size = _COLLECTION(self.buff, pos)
+            _size(size)
+            pos += 5
+            for _ in range(size):
+                pos = self.skip(pos, etype)
+            return pos
+        raise TTransport.TTransportException(
+            TTransport.TTransportException.UNKNOWN,
+            "Unknown thrift type %d" % ttype)
+
+    def fields(self, pos, handlers):
+        """Scan a struct, returning the offset following it.
+
+        handlers maps field ids to a function of the field's type and offset,
+        returning the offset following the field. Other fields are skipped.
+        """
+        while True:
+            self.need(pos + 1)
+            if self.buff[pos] == TType.STOP:
+                return pos + 1
+            self.need(pos + 3)
+            ttype, fid = _FIELD(self.buff, pos)
+            handler = handlers.get(fid)
+            if handler is None:
+                pos = self.skip(pos + 3, ttype)
+            else:
+                pos = handler(ttype, pos + 3)
+
+
+def _size(size):
+    """Check a string length or collection size is not negative"""
+    if size < 0:
+        raise TTransport.TTransportException(
+            TTransport.TTransportException.NEGATIVE_SIZE,
+            "Negative length: %d" % size)
+    return size
+
+
+def _decode_string(buff, pos):
+    """Decode the binary protocol string at an offset"""
+    start = pos + 4
+    return buff[start:start + _I32(buff, pos)[0]].decode("utf-8")
+
+
+class LazyRows(Sequence):
+    """The rows of a query result, decoded as they are accessed
+
+    The reply is kept as received. The offset of every row and column name
+    is indexed once, so a row is decoded to a dict only when it is read and
+    a column is decoded without decoding the other columns.
+    """
+
+    def __init__(self, buff, rows, cells):
+        """
+        Keyword arguments:
+        buff -- the raw reply
+        rows -- the index in cells of each row's first column, and the
+            number of cells
+        cells -- the offset of every column name in the reply
+        """
+        self._buff = buff
+        self._rows = rows
+        self._cells = cells
+
+    def __len__(self):
+        return len(self._rows) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._row(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("row index out of range")
+        return self._row(index)
+
+    def __eq__(self, other):
+        return isinstance(other, (list, LazyRows)) and \
+            len(self) == len(other) and list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "%s(%d rows)" % (self.__class__.__name__, len(self))
+
+    def _row(self, index):
+        """Decode a row to a dict"""
+        buff = self._buff
+        row = {}
+        for cell in self._cells[self._rows[index]:self._rows[index + 1]]:
+            value = cell + 4 + _I32(buff, cell)[0]
+            row[_decode_string(buff, cell)] = _decode_string(buff, value)
+        return row
+
+    def column(self, name, default=None):
+        """Decode the values of one column, default where a row lacks it."""
+        buff = self._buff
+        return [default if value is None else _decode_string(buff, value)
+                for value in self._values(name)]
+
+    def raw_column(self, name):
+        """The undecoded UTF-8 values of one column, None where a row lacks
+        it."""
+        buff = self._buff
+        return [None if value is None else
+                buff[value + 4:value + 4 + _I32(buff, value)[0]]
+                for value in self._values(name)]
+
+    def _values(self, name):
+        """The offset of each row's value of a column, or None"""
+        buff = self._buff
+        cells = self._cells
+        key = name.encode("utf-8")
+        size = len(key)
+        values = []
+        # Rows usually list their columns in the same order, the position
+        # of the column in the previous row is tried first.
+        position = 0
+        rows = self._rows
+        for index in range(len(self)):
+            start, end = rows[index], rows[index + 1]
+            found = None
+            if start + position < end and \
+                    _is_key(buff, cells[start + position], key, size):
+                found = cells[start + position]
+            else:
+                for i in range(start, end):
+                    if _is_key(buff, cells[i], key, size):
+                        found = cells[i]
+                        position = i - start
+                        break
+            values.append(None if found is None else found + 4 + size)
+        return values
+
+
+def _is_key(buff, cell, key, size):
+    """Check if the column name at an offset is the encoded key"""
+    return _I32(buff, cell)[0] == size and \
+        buff[cell + 4:cell + 4 + size] == key
+
+
+def read_query_reply(iprot):
+    """Read an ExtensionManager query reply, with rows decoded on access.
+
+    Returns an ExtensionResponse whose response is a LazyRows sequence.
+    """
+    (_, mtype, _) = iprot.readMessageBegin()
+    if mtype == TMessageType.EXCEPTION:
+        x = TApplicationException()
+        x.read(iprot)
+        iprot.readMessageEnd()
+        raise x
+
+    reply = _Reply(iprot.trans)
+    response = ExtensionResponse()
+    rows = array(str("l"), [0])
+    cells = array(str("l"))
+
+    def read_status(ttype, pos):
+        end = reply.skip(pos, ttype)
+        reply.need(end)
+        if ttype == TType.STRUCT:
+            response.status = ExtensionStatus()
+            response.status.read(TBinaryProtocol.TBinaryProtocol(
+                TTransport.TMemoryBuffer(bytes(reply.buff[pos:end]))))
+        return end
+
+    def read_rows(ttype, pos):
+        if ttype != TType.LIST:
+            return reply.skip(pos, ttype)
+        reply.need(pos + 5)
+        etype, size = _COLLECTION(reply.buff, pos)
+        _size(size)
+        pos += 5
+        if etype != TType.MAP:
+            for _ in range(size):
+                pos = reply.skip(pos, etype)
+            return pos
+        # This loop visits every cell, so lookups are hoisted into locals.
+        buff = reply.buff
+        unpack = _I32
+        add_cell = cells.append
+        for _ in range(size):
+            reply.need(pos + 6)
+            ktype, vtype, count = _MAP(buff, pos)
+            _size(count)
+            pos += 6
+            if ktype != TType.STRING or vtype != TType.STRING:
+                for _ in range(count):
+                    pos = reply.skip(reply.skip(pos, ktype), vtype)
+                rows.append(len(cells))
+                continue
+            have = len(buff)
+            for _ in range(count):
+                add_cell(pos)
+                if pos + 4 > have:
+                    reply.need(pos + 4)
+                    have = len(buff)
+                length = unpack(buff, pos)[0]
+                if length < 0:
+                    _size(length)
+                pos += 4 + length
+                if pos + 4 > have:
+                    reply.need(pos + 4)
+                    have = len(buff)
+                length = unpack(buff, pos)[0]
+                if length < 0:
+                    _size(length)
+                pos += 4 + length
+            rows.append(len(cells))
+        response.response = LazyRows(buff, rows, cells)
+        return pos
+
+    success = []
+
+    def read_success(ttype, pos):
+        if ttype != TType.STRUCT:
+            return reply.skip(pos, ttype)
+        success.append(True)
+        return reply.fields(pos, {1: read_status, 2: read_rows})
+
+    reply.fields(0, {0: read_success})
+    iprot.readMessageEnd()
+    if not success:
+        raise TApplicationException(TApplicationException.MISSING_RESULT,
+                                    "query failed: unknown result")
+    return response
+
+
+def _parse(parse, raws, null):
+    """Parse raw values, null where a value is missing or not a number"""
+    values = []
+    append = values.append
+    for raw in raws:
+        try:
+            append(parse(raw))
+        except (TypeError, ValueError):
+            append(null)
+    return values
+
+
+def _array(typecode, values, null):
+    """An array of values, null where a value is out of the type's range"""
+    try:
+        return array(typecode, values)
+    except OverflowError:
+        column = array(typecode)
+        for value in values:
+            try:
+                column.append(value)
+            except OverflowError:
+                column.append(null)
+        return column
+
+
+def columnar_rows(rows, columns, container=LIST_COLUMNS):
+    """Decode query rows into one typed sequence per column.
+
+    INTEGER, BIGINT, UNSIGNED BIGINT and DOUBLE columns are parsed to numbers
+    straight from the raw reply, other columns are decoded to strings.
+
+    Keyword arguments:
+    rows -- the LazyRows of a query
+    columns -- the (name, type) of each column, as reported by osquery
+        core's getQueryColumns
+    container -- one of COLUMN_CONTAINERS. LIST_COLUMNS and ARRAY_COLUMNS
+        return an OrderedDict of columns, ARRAY_COLUMNS keeps text columns as
+        lists. NUMPY_COLUMNS returns a structured array, text fields are
+        Python objects.
+    """
+    if container not in COLUMN_CONTAINERS:
+        raise ValueError("Unknown column container: %s" % container)
+    result = OrderedDict()
+    dtype = []
+    for name, column_type in columns:
+        numeric = _NUMERIC_TYPES.get(column_type)
+        if numeric is None:
+            result[name] = rows.column(name)
+            dtype.append((str(name), "O"))
+            continue
+        parse, typecode, numpy_type, fill = numeric
+        if container == LIST_COLUMNS:
+            result[name] = _parse(parse, rows.raw_column(name), None)
+        else:
+            result[name] = _array(typecode,
+                                  _parse(parse, rows.raw_column(name), fill),
+                                  fill)
+        dtype.append((str(name), numpy_type))
+    if container != NUMPY_COLUMNS:
+        return result
+
+    import numpy
+    structured = numpy.zeros(len(rows), dtype=dtype)
+    for name, values in result.items():
+        structured[str(name)] = values
+    return structured
@@ -0,0 +1,152 @@
+"""This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import struct
+
+from thrift.Thrift import TType
+from thrift.protocol import TBinaryProtocol
+from thrift.transport import TTransport
+
+from osquery.extensions.ttypes import ExtensionResponse
+from osquery.protocol import response_encoder
+
+
+_I32 = struct.Struct(">i").pack
+_I64 = struct.Struct(">q").pack
+
+# Column names repeat in every row, so their encoding is cached. The cache is
+# bounded in case a plugin uses arbitrary keys.
+_ENCODED_KEYS = {}
+_MAX_ENCODED_KEYS = 4096
+
+
+def _encode_string(value):
+    """Encode a string as the binary protocol's length and UTF-8 bytes"""
+    value = value.encode("utf-8")
+    return _I32(len(value)) + value
+
+
+_FAST_ENCODE = response_encoder()
+
+
+def encode_response(response):
+    """Encode an ExtensionResponse struct with the binary protocol.
+
+    thrift's C extension encodes the struct when it is installed. Otherwise
+    the struct is written straight into one buffer, without the protocol
+    calls the generated ExtensionResponse.write makes for every string. The
+    encoding is byte for byte the same.
+    """
+    if _FAST_ENCODE is not None:
+        return _FAST_ENCODE(response)
+    return _encode_response(response)
+
+
+def _encode_response(response):
+    """Encode an ExtensionResponse struct in Python"""
+    buff = bytearray()
+    status = response.status
+    if status is not None:
+        buff += b"\x0c\x00\x01"
+        if status.code is not None:
+            buff += b"\x08\x00\x01" + _I32(status.code)
+        if status.message is not None:
+            buff += b"\x0b\x00\x02" + _encode_string(status.message)
+        if status.uuid is not None:
+            buff += b"\x0a\x00\x03" + _I64(status.uuid)
+        buff += b"\x00"
+    rows = response.response
+    if rows is not None:
+        buff += b"\x0f\x00\x02\x0d" + _I32(len(rows))
+        keys = _ENCODED_KEYS
+        for row in rows:
+            buff += b"\x0b\x0b" + _I32(len(row))
+            for key, value in row.items():
+                encoded = keys.get(key)
+                if encoded is None:
+                    encoded = _encode_string(key)
+                    if len(keys) < _MAX_ENCODED_KEYS:
+                        keys[key] = encoded
+                buff += encoded
+                value = value.encode("utf-8")
+                buff += _I32(len(value))
+                buff += value
+    buff += b"\x00"
+    return bytes(buff)
+
+
+def decode_response(payload):
+    """Decode an ExtensionResponse struct encoded with the binary protocol"""
+    response = ExtensionResponse()
+    response.read(TBinaryProtocol.TBinaryProtocol(
+        TTransport.TMemoryBuffer(payload)))
+    return response
+
+
+class EncodedExtensionResponse(ExtensionResponse):
+    """An ExtensionResponse holding its binary protocol encoding
+
+    The extension processor writes the encoded payload straight to the
+    transport, the response is only decoded if its status or rows are read.
+    """
+
+    def __init__(self, payload):  # pylint: disable=super-init-not-called
+        self.payload = payload
+        self._decoded = None
+
+    def _decode(self):
+        if self._decoded is None:
+            self._decoded = decode_response(self.payload)
+        return self._decoded
+
+    @property
+    def status(self):
+        """The decoded ExtensionStatus"""
+        return self._decode().status
+
+    @property
+    def response(self):
+        """The decoded rows"""
+        return self._decode().response
+
+    def write(self, oprot):
+        oprot.trans.write(self.payload)
+
+    def __repr__(self):
+        return "%s(%d bytes)" % (self.__class__.__name__, len(self.payload))
+
+    def __eq__(self, other):
+        return isinstance(other, ExtensionResponse) and \
+            self.status == other.status and self.response == other.response
+
+
+def write_call_result(oprot, result):
+    """Write a call_result struct, copying encoded responses verbatim.
+
+    The generated call_result.write hands the whole struct to the
+    accelerated encoder when it is available, which would decode and encode
+    an EncodedExtensionResponse again. With the pure Python binary protocol
+    responses are encoded by encode_response.
+    """
+    success = getattr(result, "success", None)
+    if isinstance(success, EncodedExtensionResponse):
+        payload = success.payload
+    elif isinstance(success, ExtensionResponse) and \
+            type(oprot) is TBinaryProtocol.TBinaryProtocol:
+        payload = encode_response(success)
+    else:
+        result.write(oprot)
+        return
+    oprot.writeStructBegin("call_result")
+    oprot.writeFieldBegin("success", TType.STRUCT, 0)
+    oprot.trans.write(payload)
+    oprot.writeFieldEnd()
+    oprot.writeFieldStop()
+    oprot.writeStructEnd()
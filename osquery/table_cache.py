@@ -0,0 +1,254 @@
+"""This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from builtins import str
+from collections import OrderedDict
+import threading
+import time
+
+
+def context_key(context):
+    """A hashable key identifying the results of a query context.
+
+    Constraints are sorted so that equivalent contexts, such as the same IN
+    list in a different order, share one key.
+    """
+    constraints = []
+    for constraint in context.get("constraints", []):
+        items = tuple(sorted(set((int(item["op"]), item["expr"])
+                                 for item in constraint.get("list", []))))
+        if items:
+            constraints.append((constraint["name"], items))
+    used = context.columns_used()
+    if used is not None:
+        used = tuple(sorted(used))
+    return tuple(sorted(constraints)), used
+
+
+def response_size(response):
+    """Estimate the number of bytes of the rows in a response"""
+    size = 0
+    for row in response.response:
+        for key, value in row.items():
+            size += len(key) + len(value)
+    return size
+
+
+class RowIndex(object):
+    """The rows of a cached response and hash indexes of their values
+
+    The index of a column is built the first time a query selects rows by an
+    equality constraint on that column.
+    """
+
+    def __init__(self, response, context):
+        """
+        Keyword arguments:
+        response -- the cached ExtensionResponse
+        context -- the QueryContext the response was generated for
+        """
+        self.response = response
+        self.context = context
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def select(self, context):
+        """The rows that may match a narrower query context.
+
+        Rows are looked up by the most selective equality constraint, then
+        filtered by the remaining constraints and reduced to the used columns.
+        """
+        # pylint: disable=protected-access
+        column = None
+        values = None
+        for name in context.constrained_columns():
+            equals = context.equals(name)
+            cast = context._casts.get(name) or str
+            if equals is None or not all(isinstance(value, cast)
+                                         for value in equals):
+                # SQLite may find an unconverted expression equal, such as
+                # 5.0 for an INTEGER column, which the index cannot.
+                continue
+            if values is None or len(equals) < len(values):
+                column, values = name, equals
+        if column is None:
+            rows = self.response.response
+        else:
+            index = self._index(column, context)
+            rows = [row for value in values for row in index.get(value, [])]
+        matches = context.row_filter()
+        if matches is not None:
+            rows = [row for row in rows if matches(row)]
+        used = context.columns_used()
+        if used is not None and used != self.context.columns_used():
+            rows = [dict((key, row[key]) for key in used if key in row)
+                    for row in rows]
+        return rows
+
+    def _index(self, column, context):
+        """The rows grouped by their value of a column."""
+        index = self._indexes.get(column)
+        if index is None:
+            with self._lock:
+                index = self._indexes.get(column)
+                if index is None:
+                    index = {}
+                    for row in self.response.response:
+                        if column in row:
+                            index.setdefault(context.cast(column, row[column]),
+                                             []).append(row)
+                    self._indexes[column] = index
+        return index
+
+
+class TableCache(object):
+    """A time-to-live and least recently used cache of table responses
+
+    Entries expire ttl seconds after they were stored. When the cache holds
+    more than max_entries responses, or more than max_bytes of row data, the
+    least recently used entries are evicted.
+
+    An expired entry may still be served for max_stale seconds while a single
+    caller refreshes it, see lookup. Entries stored with their query context
+    can also answer narrower queries, see lookup_superset.
+    """
+
+    def __init__(self, ttl, max_entries=128, max_bytes=None, max_stale=0):
+        """
+        Keyword arguments:
+        ttl -- the number of seconds a response stays valid
+        max_entries -- the maximum number of cached responses
+        max_bytes -- the maximum estimated size of all cached rows
+        max_stale -- the number of seconds past expiry a response is served
+            while it is being refreshed
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_stale = max_stale
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.subsumed_hits = 0
+        self._bytes = 0
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached response for a key, or None"""
+        return self.lookup(key)[0]
+
+    def lookup(self, key):
+        """Find the cached response for a key.
+
+        Returns the response, or None on a miss, and whether the caller must
+        refresh the entry. A stale response is returned with refresh set for
+        the first caller only, later callers are served the stale response
+        until that refresh is stored or abandoned.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[0] + self.max_stale <= now:
+                if entry is not None:
+                    self._bytes -= entry[1]
+                    self._refreshing.discard(key)
+                self.misses += 1
+                return None, False
+            # Reinserting the entry marks it as the most recently used.
+            self._entries[key] = entry
+            if entry[0] > now:
+                self.hits += 1
+                return entry[2], False
+            self.stale_hits += 1
+            if key in self._refreshing:
+                return entry[2], False
+            self._refreshing.add(key)
+            return entry[2], True
+
+    def lookup_superset(self, context):
+        """Find a fresh cached response of a broader query context.
+
+        A response generated for a context that every row matching this
+        context also matches, such as a full scan or a larger IN list, holds
+        all of this context's rows. Returns the RowIndex of the most recently
+        used such response, or None.
+        """
+        now = time.time()
+        used = context.columns_used()
+        if used is not None:
+            used = used.union(context.constrained_columns())
+        with self._lock:
+            indexes = [entry[3]
+                       for entry in reversed(list(self._entries.values()))
+                       if entry[0] > now and entry[3] is not None]
+        for index in indexes:
+            cached_used = index.context.columns_used()
+            if cached_used is not None and (used is None or
+                                            not used <= cached_used):
+                continue
+            if context.implies(index.context):
+                with self._lock:
+                    self.subsumed_hits += 1
+                return index
+        return None
+
+    def abandon_refresh(self, key):
+        """Allow another caller to refresh a stale entry"""
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def put(self, key, response, size=0, context=None):
+        """Store a response, evicting least recently used entries.
+
+        Responses stored with their query context may answer narrower
+        queries, see lookup_superset.
+        """
+        if self.max_bytes is not None and size > self.max_bytes:
+            self.abandon_refresh(key)
+            return
+        with self._lock:
+            self._refreshing.discard(key)
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            index = None
+            if context is not None:
+                index = RowIndex(response, context)
+            self._entries[key] = (time.time() + self.ttl, size, response,
+                                  index)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or (
+                    self.max_bytes is not None and
+                    self._bytes > self.max_bytes):
+                _, entry = self._entries.popitem(last=False)
+                self._bytes -= entry[1]
+                self.evictions += 1
+
+    def clear(self):
+        """Remove every cached response"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """The cache counters, useful to tune the cache settings"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "subsumed_hits": self.subsumed_hits,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
@@ -13,17 +13,91 @@ from __future__ import unicode_literals
 from abc import ABCMeta, abstractmethod
 from builtins import str
 from collections import namedtuple
+try:
+    from collections.abc import Mapping, Sequence
+except ImportError:
+    from collections import Mapping, Sequence
 from future.utils import with_metaclass
 import json
 import logging
+from multiprocessing.pool import ThreadPool
+import sys
+import threading
 
 from osquery.extensions.ttypes import ExtensionResponse, ExtensionStatus
 from osquery.plugin import BasePlugin
+from osquery.query_context import QueryContext
+from osquery.response import EncodedExtensionResponse, encode_response
+from osquery.table_cache import TableCache, context_key, response_size
 
 class TablePlugin(with_metaclass(ABCMeta, BasePlugin)):
     """All table plugins should inherit from TablePlugin"""
 
     _no_action_message = "Table plugins must include a request action"
+    _columns_length_message = "Columnar results must have equal lengths"
+    _deadline_message = "Table deadline exceeded"
+    _max_rows_message = "Table response exceeds %d rows"
+    _max_bytes_message = "Table response exceeds %d bytes"
+    _partial_message = "Partial results, %s"
+    _row_type_message = "Table rows cannot be of type %s"
+    _column_converters = None
+    _column_names = None
+    _generating_columns = None
+    _cache = None
+    _cache_lock = threading.Lock()
+    _fanout_pool = None
+    _fanout_lock = threading.Lock()
+
+    filter_rows = True
+    """Drop generated rows that cannot match the query's =, IN, range and
+    LIKE constraints before they are converted and sent to osquery core"""
+
+    deadline = None
+    """Seconds a generate call may take, its context is then cancelled and
+    no more rows are converted"""
+
+    partial_results = False
+    """Return the rows generated before the deadline instead of an error"""
+
+    max_rows = None
+    """The maximum number of rows a generate call may return"""
+
+    max_response_bytes = None
+    """The maximum size of the converted rows of a generate call"""
+
+    truncate_results = False
+    """Return the rows within max_rows and max_response_bytes instead of an
+    error"""
+
+    fanout_column = None
+    """A column whose IN list is generated one value at a time in parallel,
+    each generate receiving a context constraining it to a single value"""
+
+    fanout_workers = 8
+    """The maximum number of values of fanout_column generated at once"""
+
+    cache_ttl = 0
+    """Seconds a generated response is cached for, 0 disables the cache"""
+
+    cache_max_entries = 128
+    """The maximum number of query contexts with a cached response"""
+
+    cache_max_bytes = None
+    """The maximum estimated size of the cached rows"""
+
+    cache_encoded = False
+    """Cache responses as their encoded thrift payload, a hit is then
+    written to the socket without encoding the rows again"""
+
+    cache_max_stale = 0
+    """Seconds past cache_ttl an expired response is served while a
+    background thread generates its replacement"""
+
+    cache_subsume = False
+    """Answer queries from the cached response of a broader query, such as
+    a full scan or a larger IN list, by filtering its rows. Queries
+    constraining an ADDITIONAL or REQUIRED column are always generated, as
+    generate adds rows for their values that a broader query may lack."""
 
     def call(self, context):
         """Internal routing for this plugin type.
@@ -37,28 +111,330 @@ class TablePlugin(with_metaclass(ABCMeta, BasePlugin)):
                 response=[],)
 
         if context["action"] == "generate":
-            ctx = {}
-            if "context" in context:
-                ctx = json.loads(context["context"])
-            rows = self.generate(ctx)
-            for i, row in enumerate(rows):
-                for key, value in row.items():
-                    if not isinstance(value, str):
-                        try:
-                            rows[i][key] = str(value)
-                        except ValueError as e:
-                            rows[i][key] = ''
-                            logging.error("Cannot convert key %s: %s" % (
-                                i, key, str(e)))
-            return ExtensionResponse(
-                status=ExtensionStatus(code=0, message="OK",),
-                response=rows)
+            ctx = self._parse_context(context)
+            key, response = self._cache_lookup(ctx)
+            if response is None:
+                response = self._cache_store(key,
+                                             self._generate_uncached(ctx),
+                                             ctx)
+            return response
         elif context["action"] == "columns":
             return ExtensionResponse(
                 status=ExtensionStatus(code=0, message="OK",),
                 response=self.routes(),)
         return ExtensionResponse(code=1, message="Unknown action",)
 
+    def cache_stats(self):
+        """The hit, miss and eviction counters of the response cache.
+
+        Returns None if the cache is disabled.
+        """
+        cache = self._table_cache()
+        if cache is None:
+            return None
+        return cache.stats()
+
+    def _table_cache(self):
+        """The response cache of this table, created on first use."""
+        if not self.cache_ttl:
+            return None
+        if self._cache is None:
+            with self._cache_lock:
+                if self._cache is None:
+                    self._cache = TableCache(self.cache_ttl,
+                                             self.cache_max_entries,
+                                             self.cache_max_bytes,
+                                             self.cache_max_stale)
+        return self._cache
+
+    def _cache_lookup(self, context):
+        """Find the cached response for a query context.
+
+        Returns the cache key and the response, which is None on a miss. A
+        stale response is returned as is and refreshed in the background.
+        With cache_subsume set, a miss may be answered by filtering the
+        response of a broader query.
+        """
+        cache = self._table_cache()
+        if cache is None:
+            return None, None
+        key = context_key(context)
+        response, refresh = cache.lookup(key)
+        if refresh:
+            rt = threading.Thread(target=self._cache_refresh,
+                                  args=(key, context))
+            rt.daemon = True
+            rt.start()
+        elif response is None and self.cache_subsume and \
+                self._subsumable(context):
+            index = cache.lookup_superset(context)
+            if index is not None:
+                response = self._cache_store(key, ExtensionResponse(
+                    status=ExtensionStatus(code=0, message="OK",),
+                    response=index.select(context)), context)
+        return key, response
+
+    def _subsumable(self, context):
+        """Check if a broader query holds every row of a query context."""
+        if self._generating_columns is None:
+            self._generating_columns = frozenset(
+                column.name for column in self.columns()
+                if column.options & (ADDITIONAL | REQUIRED))
+        return not any(column in self._generating_columns
+                       for column in context.constrained_columns())
+
+    def _cache_refresh(self, key, context):
+        """Generate and cache a replacement for a stale response."""
+        context = self._start_deadline(QueryContext(context))
+        try:
+            response = self._generate_uncached(context)
+        except Exception as e:  # pylint: disable=broad-except
+            logging.error("Cannot refresh table %s: %s" % (self.name(),
+                                                            str(e)))
+            response = None
+        if response is None or response.status.code != 0 or \
+                response.status.message != "OK":
+            # A response that is not stored must not block later refreshes.
+            self._cache.abandon_refresh(key)
+            return
+        self._cache_store(key, response, context)
+
+    def _generate_uncached(self, context):
+        """Generate and convert the response for a query context."""
+        contexts = self._fanout_contexts(context)
+        if contexts is not None:
+            return self._merge_responses(
+                self._fanout_threads().map(self._generate_uncached, contexts))
+        return self._generate_response(self.generate(context), context)
+
+    def _fanout_contexts(self, context):
+        """The single value contexts to generate in parallel, or None."""
+        if self.fanout_column is None:
+            return None
+        contexts = context.split(self.fanout_column)
+        if len(contexts) < 2:
+            return None
+        return contexts
+
+    def _fanout_threads(self):
+        """The thread pool generating values of fanout_column."""
+        if self._fanout_pool is None:
+            with self._fanout_lock:
+                if self._fanout_pool is None:
+                    self._fanout_pool = ThreadPool(self.fanout_workers)
+        return self._fanout_pool
+
+    def _merge_responses(self, responses):
+        """Concatenate the rows of responses, or return the first failure.
+
+        The budget applies to the merged rows.
+        """
+        rows = []
+        message = "OK"
+        for response in responses:
+            if response.status.code != 0:
+                return response
+            if response.status.message != "OK":
+                message = response.status.message
+            rows.extend(response.response)
+        stopped = self._check_budget(rows)
+        if stopped is not None:
+            return stopped
+        return ExtensionResponse(
+            status=ExtensionStatus(code=0, message=message,),
+            response=rows)
+
+    def _cache_store(self, key, response, context=None):
+        """Cache a successfully generated response.
+
+        Returns the response to send, which is the encoded response when
+        cache_encoded is set.
+        """
+        cache = self._table_cache()
+        if cache is None or response.status.code != 0 or \
+                response.status.message != "OK":
+            return response
+        if self.cache_encoded:
+            response = EncodedExtensionResponse(encode_response(response))
+            size = len(response.payload)
+        elif cache.max_bytes is not None:
+            size = response_size(response)
+        else:
+            size = 0
+        if not self.cache_subsume:
+            context = None
+        cache.put(key, response, size, context)
+        return response
+
+    def _parse_context(self, context):
+        """Decode the query context sent along with a generate request."""
+        if "context" in context:
+            return self._start_deadline(
+                QueryContext(json.loads(context["context"])))
+        return self._start_deadline(QueryContext())
+
+    def _start_deadline(self, context):
+        """Set the table's deadline on a query context."""
+        if self.deadline is not None:
+            context.set_deadline(self.deadline)
+        return context
+
+    def _deadline_response(self, rows, converted):
+        """The response of a generate call cancelled by its deadline."""
+        return self._stopped_response(rows, converted, self._deadline_message,
+                                      self.partial_results)
+
+    def _budget_response(self, rows, converted, message):
+        """The response of a generate call exceeding its budget."""
+        return self._stopped_response(rows, converted, message,
+                                      self.truncate_results)
+
+    def _stopped_response(self, rows, converted, message, partial):
+        """The response of a generate call stopped before its last row.
+
+        The generator, if any, is closed so that it stops producing rows.
+        The rows converted so far are returned if partial is set.
+        """
+        if hasattr(rows, "close"):
+            rows.close()
+        logging.error("Table %s stopped: %s" % (self.name(), message))
+        if partial:
+            return ExtensionResponse(
+                status=ExtensionStatus(code=0,
+                                       message=self._partial_message % (
+                                           message.lower()),),
+                response=converted)
+        return ExtensionResponse(
+            status=ExtensionStatus(code=1, message=message,),
+            response=[],)
+
+    def _generate_response(self, rows, context):
+        """Convert the rows returned by generate into a response.
+
+        Rows are converted one at a time as they are produced, so a generate
+        that yields rows never has its unconverted rows held in memory.
+        Rows that cannot match the constraints on the table's columns, and
+        columns the query does not use, are dropped before conversion.
+        Rows yielded after the context is cancelled by the deadline, or past
+        max_rows and max_response_bytes, are not generated.
+        """
+        if isinstance(rows, Mapping):
+            converters = self._converters()
+            matches = None
+            if self.filter_rows:
+                matches = context.row_filter(converters)
+            return self._columnar_response(rows, converters,
+                                           context.columns_used(), matches)
+        builder = self._response_builder(context)
+        add = builder.add
+        timed = not isinstance(rows, list) and context.deadline() is not None
+        for row in rows:
+            if timed and context.cancelled():
+                return self._deadline_response(rows, builder.response)
+            message = add(row)
+            if message is not None:
+                return self._builder_response(rows, builder, message)
+        return ExtensionResponse(
+            status=ExtensionStatus(code=0, message="OK",),
+            response=builder.response)
+
+    def _builder_response(self, rows, builder, message):
+        """The response of a generate call stopped by its response builder.
+
+        A row that cannot be converted fails the call, other messages are
+        those of the budget.
+        """
+        if builder.invalid:
+            return self._stopped_response(rows, [], message, False)
+        return self._budget_response(rows, builder.response, message)
+
+    def _response_builder(self, context):
+        """A builder converting the rows of a generate call one at a time."""
+        return _ResponseBuilder(self, context)
+
+    def _columnar_response(self, columns, converters, used, matches=None):
+        """Convert a mapping of column names to sequences into a response.
+
+        Each column is converted as a whole, array types providing astype,
+        such as NumPy arrays, are converted by a single vectorized call.
+        Rows that cannot match are dropped before they are sent, the budget
+        is applied to the converted rows.
+        """
+        names = [name for name in columns if used is None or name in used]
+        values = [_convert_column(columns[name], converters.get(name, str))
+                  for name in names]
+        if len(set(len(column) for column in values)) > 1:
+            return ExtensionResponse(
+                status=ExtensionStatus(code=1,
+                                       message=self._columns_length_message,),
+                response=[],)
+        response = [dict(zip(names, row)) for row in zip(*values)]
+        if matches is not None:
+            response = [row for row in response if matches(row)]
+        stopped = self._check_budget(response)
+        if stopped is not None:
+            return stopped
+        return ExtensionResponse(
+            status=ExtensionStatus(code=0, message="OK",),
+            response=response)
+
+    def _check_budget(self, rows):
+        """Apply max_rows and max_response_bytes to converted rows.
+
+        Returns None if the rows are within the budget, otherwise the
+        response of a generate call exceeding it.
+        """
+        max_rows = self.max_rows
+        if max_rows is not None and len(rows) > max_rows:
+            return self._budget_response(None, rows[:max_rows],
+                                         self._max_rows_message % max_rows)
+        max_bytes = self.max_response_bytes
+        if max_bytes is not None:
+            size = 0
+            for count, row in enumerate(rows):
+                for key, value in row.items():
+                    size += len(key) + len(value)
+                if size > max_bytes:
+                    return self._budget_response(
+                        None, rows[:count],
+                        self._max_bytes_message % max_bytes)
+        return None
+
+    def _converters(self):
+        """The value converter of each column, compiled once from columns.
+
+        Do not override this method.
+        """
+        if self._column_converters is None:
+            self._column_converters = dict(
+                (column.name, _CONVERTERS.get(column.type, str))
+                for column in self.columns())
+        return self._column_converters
+
+    def _names(self):
+        """The column names in the order of columns.
+
+        Do not override this method.
+        """
+        if self._column_names is None:
+            self._column_names = [column.name for column in self.columns()]
+        return self._column_names
+
+    def _convert_row(self, items, converters):
+        """Convert a row one value at a time, reporting unconvertible values.
+        """
+        converted = {}
+        for key, value in items:
+            if not isinstance(value, str):
+                try:
+                    value = converters.get(key, str)(value)
+                except ValueError as e:
+                    value = ''
+                    logging.error("Cannot convert key %s: %s" % (
+                        key, str(e)))
+            converted[key] = value
+        return converted
+
     def registry_name(self):
         """The name of the registry type for table plugins.
 
@@ -76,7 +452,7 @@ class TablePlugin(with_metaclass(ABCMeta, BasePlugin)):
                 "id": "column",
                 "name": column.name,
                 "type": column.type,
-                "op": "0",
+                "op": str(column.options),
             }
             routes.append(route)
         return routes
@@ -104,8 +480,19 @@ class TablePlugin(with_metaclass(ABCMeta, BasePlugin)):
     def generate(self, context):
         """The implementation of your table plugin.
 
+        The context is an osquery.QueryContext describing the constraints
+        of the query, a plugin may use them to only generate matching rows.
+        Columns the query does not use, see QueryContext.is_column_used, are
+        dropped from the rows and need not be computed.
+
         This method should return a list of dictionaries, such that each
         dictionary has a key corresponding to each of your table's columns.
+        Rows may also be tuples or lists holding the values in the order of
+        columns, or objects, such as instances of a class with __slots__, with an
+        attribute for each column. Both use less memory than dictionaries.
+        Large tables may instead yield each dictionary, rows are then
+        converted as they are produced rather than after the whole table is
+        built.
 
         Consider the following example:
 
@@ -121,6 +508,31 @@ class TablePlugin(with_metaclass(ABCMeta, BasePlugin)):
 
                     return query_data
 
+        Or, yielding the rows:
+
+            class MyTablePlugin(osquery.TablePlugin):
+                def generate(self, context):
+                    for i in range(5):
+                        yield {"foo": "bar", "baz": "boo"}
+
+        Or, yielding tuples in the order of columns:
+
+            class MyTablePlugin(osquery.TablePlugin):
+                def generate(self, context):
+                    for i in range(5):
+                        yield ("bar", "boo")
+
+        Tables that are naturally columnar may instead return a dictionary
+        mapping each column name to a sequence of values, such as a list,
+        an array.array or a NumPy array:
+
+            class MyTablePlugin(osquery.TablePlugin):
+                def generate(self, context):
+                    return {
+                        "foo": ["bar"] * 5,
+                        "baz": array.array("q", range(5)),
+                    }
+
         This must be implemented by your plugin.
         """
         raise NotImplementedError
@@ -131,5 +543,182 @@ STRING = "TEXT"
 INTEGER = "INTEGER"
 """The integer SQL column type"""
 
-TableColumn = namedtuple("TableColumn", ["name", "type"])
-"""An object which allows you to define the name and type of a SQL column"""
+BIGINT = "BIGINT"
+"""The 64-bit integer SQL column type"""
+
+DOUBLE = "DOUBLE"
+"""The floating point SQL column type"""
+
+# The converter applied to the values of each column type. Converters are
+# builtins wherever they produce the right text, calling a Python function for
+# every value costs more than the conversion itself.
+def _convert_double(value):
+    """Convert a value of a DOUBLE column, keeping its full precision"""
+    if isinstance(value, float):
+        return str(repr(value))
+    return str(value)
+
+if sys.version_info[0] >= 3:
+    _convert_double = str  # pylint: disable=invalid-name
+
+_CONVERTERS = {
+    STRING: str,
+    INTEGER: str,
+    BIGINT: str,
+    DOUBLE: _convert_double,
+}
+
+class _ResponseBuilder(object):
+    """Converts the rows of a generate call into a new response list
+
+    Rows are added one at a time as they are produced. The rows generate
+    returned are never modified, generate may return a list it keeps.
+    """
+
+    def __init__(self, plugin, context):
+        """
+        Keyword arguments:
+        plugin -- the TablePlugin whose rows are converted
+        context -- the QueryContext of the generate call
+        """
+        # pylint: disable=protected-access
+        converters = plugin._converters()
+        used = context.columns_used()
+        self.response = []
+        self._plugin = plugin
+        self._converters = converters
+        self._convert = converters.get
+        # Every column is converted by str on Python 3, values are then
+        # converted without looking up their column's converter.
+        self._text = all(convert is str for convert in converters.values())
+        self._used = used
+        self._matches = None
+        if plugin.filter_rows:
+            self._matches = context.row_filter(converters)
+        self._positions = [(i, name) for i, name in enumerate(plugin._names())
+                           if used is None or name in used]
+        self._max_rows = plugin.max_rows
+        self._max_bytes = plugin.max_response_bytes
+        self._size = 0
+        self.invalid = False
+        # Dictionary rows of a table without filter or budget only have
+        # their values converted.
+        self._plain = self._text and self._matches is None and \
+            self._max_rows is None and self._max_bytes is None
+
+    def add(self, row):
+        """Convert and append a row unless it cannot match.
+
+        Returns the budget message if the row exceeds max_rows or
+        max_response_bytes, the row is then not appended. Returns an error
+        message and sets invalid if the row is neither a mapping, a sequence
+        nor an object with a column attribute.
+        """
+        used = self._used
+        if self._plain and type(row) is dict:
+            try:
+                if used is None:
+                    # Copying the row and replacing its values that are not
+                    # text is faster than building a new dictionary.
+                    converted = row.copy()
+                    for key, value in row.items():
+                        if not isinstance(value, str):
+                            converted[key] = str(value)
+                    self.response.append(converted)
+                else:
+                    self.response.append({key: str(row[key])
+                                          for key in used if key in row})
+                return None
+            except ValueError:
+                pass
+        if isinstance(row, dict) or (not isinstance(row, tuple) and
+                                     isinstance(row, Mapping)):
+            if self._matches is not None and not self._matches(row):
+                return None
+            if used is None:
+                items = row.items()
+            else:
+                items = [(key, row[key]) for key in used if key in row]
+            check = None
+        else:
+            # Sequence and attribute rows are tested once converted.
+            items = _row_items(row, self._positions, self._plugin._names())
+            if items is None:
+                self.invalid = True
+                return self._plugin._row_type_message % type(row).__name__
+            check = self._matches
+        try:
+            if self._text:
+                converted = {key: str(value) for key, value in items}
+            else:
+                convert = self._convert
+                converted = {key: value if isinstance(value, str)
+                             else convert(key, str)(value)
+                             for key, value in items}
+        except ValueError:
+            # pylint: disable=protected-access
+            converted = self._plugin._convert_row(items, self._converters)
+        if check is not None and not check(converted):
+            return None
+        if self._max_rows is not None and \
+                len(self.response) >= self._max_rows:
+            return self._plugin._max_rows_message % self._max_rows
+        if self._max_bytes is not None:
+            for key, value in converted.items():
+                self._size += len(key) + len(value)
+            if self._size > self._max_bytes:
+                return self._plugin._max_bytes_message % self._max_bytes
+        self.response.append(converted)
+        return None
+
+def _row_items(row, positions, names):
+    """The (column name, value) pairs of a sequence row or a row object
+
+    Returns None if the row is text or an object without any column
+    attribute, rather than an empty row.
+    """
+    if isinstance(row, (tuple, list)) or (
+            isinstance(row, Sequence) and
+            not isinstance(row, (str, bytes, bytearray))):
+        size = len(row)
+        return [(name, row[i]) for i, name in positions if i < size]
+    if isinstance(row, (str, bytes, bytearray)):
+        return None
+    items = [(name, getattr(row, name)) for _, name in positions
+             if hasattr(row, name)]
+    if not items and not any(hasattr(row, name) for name in names):
+        return None
+    return items
+
+def _convert_column(values, converter):
+    """Convert a sequence of column values to a list of strings"""
+    if hasattr(values, "astype") and hasattr(values, "tolist"):
+        return values.astype(str).tolist()
+    return list(map(converter, values))
+
+INDEX = 1
+"""The column is used as an index, osquery core pushes its constraints"""
+
+REQUIRED = 2
+"""The column must be constrained for the table to be queried"""
+
+ADDITIONAL = 4
+"""The column is an additional index, only generating extra rows"""
+
+OPTIMIZED = 8
+"""The table can generate rows for this column's constraints efficiently"""
+
+HIDDEN = 16
+"""The column is not returned by SELECT *"""
+
+class TableColumn(namedtuple("TableColumn", ["name", "type", "options"])):
+    """An object which allows you to define the name and type of a SQL column
+
+    Column options, such as osquery.INDEX or osquery.REQUIRED, tell osquery
+    core's planner how the table uses constraints on the column. Options may
+    be combined, for example INDEX | REQUIRED.
+    """
+    __slots__ = ()
+
+    def __new__(cls, name, type, options=0):  # pylint: disable=redefined-builtin
+        return super(TableColumn, cls).__new__(cls, name, type, options)
@@ -0,0 +1,187 @@
+"""This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from io import BytesIO
+import os
+import socket
+
+from thrift.transport.TTransport import CReadableTransport, \
+    TTransportBase, TTransportException
+
+# The number of buffers a single sendmsg may gather.
+try:
+    _IOV_MAX = os.sysconf("SC_IOV_MAX")
+except (AttributeError, ValueError, OSError):
+    _IOV_MAX = 16
+
+# Writes at least this large are sent from the caller's buffer rather than
+# copied into the write buffer.
+_LARGE_WRITE = 65536
+
+
+class TLargeBufferedTransport(TTransportBase, CReadableTransport):
+    """A buffered transport for large messages on a socket
+
+    Reads are buffered in a buffer that doubles, up to max_rbuf_size, while
+    the peer keeps it full. Reads larger than the buffer are received
+    straight into the returned buffer. Large writes are not copied, a flush
+    sends all the written buffers with one gather write where sendmsg is
+    available.
+    """
+
+    DEFAULT_BUFFER = 65536
+    MAX_BUFFER = 4 * 1024 * 1024
+
+    def __init__(self, trans, rbuf_size=DEFAULT_BUFFER,
+                 max_rbuf_size=MAX_BUFFER):
+        """
+        Keyword arguments:
+        trans -- the TSocket to buffer
+        rbuf_size -- the initial size of the read buffer
+        max_rbuf_size -- the size the read buffer may grow to
+        """
+        self._trans = trans
+        self._rbuf = BytesIO(b"")
+        self._rbuf_size = rbuf_size
+        self._max_rbuf_size = max_rbuf_size
+        self._wbufs = []
+        self._wbuf = bytearray()
+
+    def isOpen(self):
+        return self._trans.isOpen()
+
+    def open(self):
+        return self._trans.open()
+
+    def close(self):
+        return self._trans.close()
+
+    def read(self, sz):
+        ret = self._rbuf.read(sz)
+        if ret:
+            return ret
+        self._rbuf = BytesIO(self._fill(sz))
+        return self._rbuf.read(sz)
+
+    def readAll(self, sz):
+        ret = self._rbuf.read(sz)
+        if len(ret) == sz:
+            return ret
+        if sz - len(ret) <= self._rbuf_size:
+            return ret + TTransportBase.readAll(self, sz - len(ret))
+        # Receive large strings in place instead of joining chunks.
+        buff = bytearray(sz)
+        buff[:len(ret)] = ret
+        view = memoryview(buff)
+        have = len(ret)
+        while have < sz:
+            have += self._recv_into(view[have:])
+        return bytes(buff)
+
+    def _fill(self, sz):
+        """Read at least one byte, and up to the read buffer size"""
+        buff = self._trans.read(max(sz, self._rbuf_size))
+        if len(buff) == self._rbuf_size and \
+                self._rbuf_size < self._max_rbuf_size:
+            self._rbuf_size = min(self._rbuf_size * 2, self._max_rbuf_size)
+        return buff
+
+    def _recv_into(self, view):
+        """Receive into a buffer, returning the number of bytes received"""
+        try:
+            received = self._trans.handle.recv_into(view)
+        except socket.timeout as e:
+            raise TTransportException(type=TTransportException.TIMED_OUT,
+                                      message="read timeout", inner=e)
+        except socket.error as e:
+            raise TTransportException(message="unexpected exception",
+                                      inner=e)
+        if received == 0:
+            raise TTransportException(type=TTransportException.END_OF_FILE,
+                                      message="TSocket read 0 bytes")
+        return received
+
+    def write(self, buf):
+        if len(buf) < _LARGE_WRITE:
+            self._wbuf += buf
+            return
+        if self._wbuf:
+            self._wbufs.append(self._wbuf)
+            self._wbuf = bytearray()
+        self._wbufs.append(buf)
+
+    def flush(self):
+        buffers = self._wbufs
+        if self._wbuf:
+            buffers.append(self._wbuf)
+        # Reset the buffers first to preserve state on a failed send.
+        self._wbufs = []
+        self._wbuf = bytearray()
+        if not buffers:
+            return
+        handle = self._trans.handle
+        if handle is None:
+            raise TTransportException(type=TTransportException.NOT_OPEN,
+                                      message="Transport not open")
+        try:
+            if hasattr(handle, "sendmsg"):
+                _send_gather(handle, buffers)
+            else:
+                for buff in buffers:
+                    handle.sendall(buff)
+        except socket.error as e:
+            raise TTransportException(message="unexpected exception",
+                                      inner=e)
+
+    # Implement the CReadableTransport interface.
+    @property
+    def cstringio_buf(self):
+        return self._rbuf
+
+    def cstringio_refill(self, partialread, reqlen):
+        retstring = partialread
+        if reqlen < self._rbuf_size:
+            # try to make a read of as much as we can.
+            retstring += self._fill(reqlen)
+        # but make sure we do read reqlen bytes.
+        if len(retstring) < reqlen:
+            retstring += self.readAll(reqlen - len(retstring))
+        self._rbuf = BytesIO(retstring)
+        return self._rbuf
+
+
+def _send_gather(handle, buffers):
+    """Send buffers with as few sendmsg calls as the socket allows"""
+    views = [memoryview(buff) for buff in buffers]
+    first = 0
+    while first < len(views):
+        sent = handle.sendmsg(views[first:first + _IOV_MAX])
+        if sent == 0:
+            raise TTransportException(type=TTransportException.END_OF_FILE,
+                                      message="TSocket sent 0 bytes")
+        # Skip the buffers that were sent, and the sent part of the next.
+        while first < len(views) and sent >= len(views[first]):
+            sent -= len(views[first])
+            first += 1
+        if sent:
+            views[first] = views[first][sent:]
+
+
+class TLargeBufferedTransportFactory(object):
+    """Factory transport that builds large buffered transports"""
+
+    def __init__(self, rbuf_size=TLargeBufferedTransport.DEFAULT_BUFFER,
+                 max_rbuf_size=TLargeBufferedTransport.MAX_BUFFER):
+        self.rbuf_size = rbuf_size
+        self.max_rbuf_size = max_rbuf_size
+
+    def getTransport(self, trans):
+        return TLargeBufferedTransport(trans, self.rbuf_size,
+                                       self.max_rbuf_size)
@@ -93,6 +93,7 @@ setup(name=TITLE,
       ],
       extras_require={
           ':sys_platform == "win32"': ['pywin32'],
+          'numpy': ['numpy'],
       },
       test_suite="tests",
       cmdclass={
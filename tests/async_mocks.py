@@ -0,0 +1,83 @@
+"""This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+import asyncio
+
+import osquery
+from osquery.extensions.ttypes import ExtensionStatus
+
+class MockAsyncTablePlugin(osquery.AsyncTablePlugin):
+    """Mock asynchronous table plugin for testing the asyncio server"""
+    def name(self):
+        return "async_foobar"
+
+    def columns(self):
+        return [
+            osquery.TableColumn(name="foo", type=osquery.STRING),
+            osquery.TableColumn(name="int", type=osquery.INTEGER),
+        ]
+
+    async def generate(self, context):
+        return [{"foo": "bar", "int": 42}]
+
+class MockAsyncGeneratorTablePlugin(osquery.AsyncTablePlugin):
+    """Mock table plugin with an asynchronous generator"""
+    def name(self):
+        return "async_foobar_generator"
+
+    def columns(self):
+        return [osquery.TableColumn(name="int", type=osquery.INTEGER)]
+
+    async def generate(self, context):
+        for i in range(3):
+            yield {"int": i}
+
+class MockAsyncBudgetTablePlugin(osquery.AsyncTablePlugin):
+    """Mock table plugin with an endless asynchronous generator"""
+
+    max_rows = 3
+    truncate_results = True
+
+    def name(self):
+        return "async_foobar_budget"
+
+    def columns(self):
+        return [osquery.TableColumn(name="int", type=osquery.INTEGER)]
+
+    async def generate(self, context):
+        i = 0
+        while True:
+            yield {"int": i}
+            i += 1
+
+class MockAsyncStalledTablePlugin(osquery.AsyncTablePlugin):
+    """Mock table plugin with an asynchronous generator stalling between
+    rows"""
+
+    deadline = 0.2
+    partial_results = True
+
+    def name(self):
+        return "async_foobar_stalled"
+
+    def columns(self):
+        return [osquery.TableColumn(name="int", type=osquery.INTEGER)]
+
+    async def generate(self, context):
+        yield {"int": 0}
+        await asyncio.sleep(5)
+        yield {"int": 1}
+
+class MockAsyncLoggerPlugin(osquery.AsyncLoggerPlugin):
+    """Mock asynchronous logger plugin for testing the asyncio server"""
+
+    logs = []
+
+    def name(self):
+        return "async_foobar"
+
+    async def log_string(self, value):
+        self.logs.append(value)
+        return ExtensionStatus(code=0, message="OK")
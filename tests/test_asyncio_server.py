@@ -0,0 +1,176 @@
+"""This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                "../build/lib/")))
+
+from thrift.Thrift import TMessageType, TType
+from thrift.protocol import TBinaryProtocol
+from thrift.transport import TSocket, TTransport
+
+import osquery
+from osquery.processor import ExtensionProcessor
+
+if sys.version_info >= (3, 6):
+    from osquery.asyncio_server import TAsyncioServer, _MessageScanner
+    from tests.async_mocks import MockAsyncBudgetTablePlugin, \
+        MockAsyncGeneratorTablePlugin, MockAsyncLoggerPlugin, \
+        MockAsyncStalledTablePlugin, MockAsyncTablePlugin
+
+@unittest.skipIf(sys.version_info < (3, 6) or
+                 sys.platform == osquery.WINDOWS_PLATFORM,
+                 "The asyncio tests require Python 3.6 and UNIX sockets")
+class TestAsyncioServer(unittest.TestCase):
+    """Tests for osquery.asyncio_server.TAsyncioServer"""
+
+    @classmethod
+    def setUpClass(cls):
+        ext_manager = osquery.ExtensionManager()
+        ext_manager.add_plugin(MockAsyncTablePlugin)
+        ext_manager.add_plugin(MockAsyncLoggerPlugin)
+        cls.directory = tempfile.mkdtemp()
+        cls.path = os.path.join(cls.directory, "osquery.em")
+        server = TAsyncioServer(ExtensionProcessor(ext_manager),
+                                TSocket.TServerSocket(unix_socket=cls.path))
+        thread = threading.Thread(target=server.serve)
+        thread.daemon = True
+        thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def _client(self):
+        client = osquery.ExtensionClient(path=self.path)
+        self.assertTrue(client.open(timeout=2, interval=0.05))
+        self.addCleanup(client.close)
+        return client.extension_client()
+
+    def test_ping(self):
+        """Tests that pings are answered by the asyncio server"""
+        self.assertEqual(self._client().ping().code, 0)
+
+    def test_async_table_call(self):
+        """Tests that asynchronous table plugins are awaited"""
+        client = self._client()
+        for _ in range(2):
+            results = client.call("table", "async_foobar",
+                                  {"action": "generate"})
+            self.assertEqual(results.status.code, 0)
+            self.assertEqual(results.response, [{"foo": "bar", "int": "42"}])
+
+    def test_async_logger_call(self):
+        """Tests that asynchronous logger plugins are awaited"""
+        results = self._client().call("logger", "async_foobar",
+                                      {"string": "test_log_string"})
+        self.assertEqual(results.status.code, 0)
+        self.assertTrue("test_log_string" in MockAsyncLoggerPlugin().logs)
+
+    def test_unknown_registry(self):
+        """Tests that unknown registries are reported in the status"""
+        results = self._client().call("unknown", "async_foobar", {})
+        self.assertEqual(results.status.code, 1)
+
+    def test_async_plugin_sync_call(self):
+        """Tests that asynchronous plugins can be called synchronously"""
+        results = MockAsyncTablePlugin().call({"action": "generate"})
+        self.assertEqual(results.response, [{"foo": "bar", "int": "42"}])
+
+    def test_async_generator_call(self):
+        """Tests that asynchronous generators are consumed"""
+        results = MockAsyncGeneratorTablePlugin().call({"action": "generate"})
+        self.assertEqual(results.response,
+                         [{"int": "0"}, {"int": "1"}, {"int": "2"}])
+
+    def test_async_generator_deadline(self):
+        """Tests that a generator stalled between rows stops at the deadline
+        """
+        start = time.time()
+        results = MockAsyncStalledTablePlugin().call({"action": "generate"})
+        self.assertTrue(time.time() - start < 1)
+        self.assertEqual(results.status.code, 0)
+        self.assertNotEqual(results.status.message, "OK")
+        self.assertEqual(results.response, [{"int": "0"}])
+
+    def test_async_generator_budget(self):
+        """Tests that asynchronous generators stop at the row budget"""
+        results = MockAsyncBudgetTablePlugin().call({"action": "generate"})
+        self.assertEqual(results.status.code, 0)
+        self.assertEqual(results.response,
+                         [{"int": "0"}, {"int": "1"}, {"int": "2"}])
+
+def scanned_message():
+    """A message using every kind of thrift value"""
+    trans = TTransport.TMemoryBuffer()
+    oprot = TBinaryProtocol.TBinaryProtocol(trans)
+    oprot.writeMessageBegin("call", TMessageType.CALL, 7)
+    oprot.writeStructBegin("args")
+    oprot.writeFieldBegin("counts", TType.MAP, 1)
+    oprot.writeMapBegin(TType.STRING, TType.I32, 2)
+    for key in ("a", "bb"):
+        oprot.writeString(key)
+        oprot.writeI32(len(key))
+    oprot.writeFieldBegin("items", TType.LIST, 2)
+    oprot.writeListBegin(TType.STRUCT, 2)
+    for value in (1, 2):
+        oprot.writeFieldBegin("value", TType.I64, 1)
+        oprot.writeI64(value)
+        oprot.writeFieldBegin("ratio", TType.DOUBLE, 2)
+        oprot.writeDouble(value / 2)
+        oprot.writeFieldStop()
+    oprot.writeFieldBegin("flags", TType.SET, 3)
+    oprot.writeSetBegin(TType.BOOL, 1)
+    oprot.writeBool(True)
+    oprot.writeFieldBegin("name", TType.STRING, 4)
+    oprot.writeString("x" * 10000)
+    oprot.writeFieldStop()
+    oprot.writeMessageEnd()
+    return trans.getvalue()
+
+@unittest.skipIf(sys.version_info < (3, 6), "Requires Python 3.6")
+class TestMessageScanner(unittest.TestCase):
+    """Tests for osquery.asyncio_server._MessageScanner"""
+
+    def test_scan_in_chunks(self):
+        """Tests that a message read in chunks ends where it was written"""
+        message = scanned_message()
+        stream = message * 2
+        for chunk in (1, 7, 4096, len(message)):
+            scanner = _MessageScanner()
+            buff = bytearray()
+            sizes = []
+            for start in range(0, len(stream), chunk):
+                buff.extend(stream[start:start + chunk])
+                sizes.append(scanner.scan(buff))
+            self.assertEqual([size for size in sizes if size is not None][0],
+                             len(message))
+            self.assertTrue(scanner.pos <= len(message))
+
+    def test_negative_sizes(self):
+        """Tests that negative lengths and sizes are rejected"""
+        header = bytearray(b"\x80\x01\x00\x01\x00\x00\x00\x04call"
+                           b"\x00\x00\x00\x00")
+        for value in (b"\x0b\x00\x01\xff\xff\xff\xf9",
+                      b"\x0d\x00\x01\x0b\x0b\xff\xff\xff\xff",
+                      b"\x0f\x00\x01\x0b\xff\xff\xff\xff"):
+            scanner = _MessageScanner()
+            self.assertRaises(TTransport.TTransportException, scanner.scan,
+                              header + value)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+"""This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                "../build/lib/")))
+
+import osquery
+
+class MockSlowTablePlugin(osquery.TablePlugin):
+    """Mock table plugin with a slow generate"""
+
+    generated = 0
+
+    def name(self):
+        return "foobar_slow"
+
+    def columns(self):
+        return [osquery.TableColumn(name="foo", type=osquery.STRING)]
+
+    def generate(self, context):
+        MockSlowTablePlugin.generated += 1
+        time.sleep(0.2)
+        return [{"foo": "bar"}]
+
+class TestExtensionManager(unittest.TestCase):
+    """Tests for osquery.ExtensionManager"""
+
+    def test_concurrent_calls_are_coalesced(self):
+        """Tests that identical in flight table calls share one generate"""
+        ext_manager = osquery.ExtensionManager()
+        ext_manager.add_plugin(MockSlowTablePlugin)
+        generated = MockSlowTablePlugin.generated
+        results = []
+
+        def call():
+            results.append(ext_manager.call("table", "foobar_slow",
+                                            {"action": "generate"}))
+
+        threads = [threading.Thread(target=call) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(MockSlowTablePlugin.generated, generated + 1)
+        self.assertEqual(len(results), 4)
+        for result in results:
+            self.assertEqual(result.response, [{"foo": "bar"}])
+
+    def test_unknown_plugin(self):
+        """Tests that calls to unknown plugins report an error status"""
+        results = osquery.ExtensionManager().call("table", "unknown",
+                                                  {"action": "generate"})
+        self.assertEqual(results.status.code, 1)
+
+if __name__ == '__main__':
+    unittest.main()
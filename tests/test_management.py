@@ -0,0 +1,139 @@
+"""This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import multiprocessing
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                "../build/lib/")))
+
+from thrift.protocol import TBinaryProtocol
+from thrift.server import TServer
+from thrift.transport import TSocket
+from thrift.transport import TTransport
+
+import osquery
+from osquery.processor import ExtensionProcessor
+from osquery.management import create_server
+from osquery.prefork_server import TPreforkServer
+
+class TestManagement(unittest.TestCase):
+    """Tests for osquery.management"""
+
+    def _create_server(self, workers, mode=osquery.THREADS_SERVER):
+        processor = ExtensionProcessor(osquery.ExtensionManager())
+        return create_server(processor,
+                             None,
+                             TTransport.TBufferedTransportFactory(),
+                             TBinaryProtocol.TBinaryProtocolFactory(),
+                             workers,
+                             mode)
+
+    def test_single_worker_server(self):
+        """Tests that a single worker uses the simple server"""
+        server = self._create_server(1)
+        self.assertTrue(isinstance(server, TServer.TSimpleServer))
+
+    def test_thread_pool_server(self):
+        """Tests that multiple workers use a thread pool server"""
+        server = self._create_server(4)
+        self.assertTrue(isinstance(server, TServer.TThreadPoolServer))
+        self.assertEqual(server.threads, 4)
+        self.assertTrue(server.daemon)
+
+    def test_prefork_server(self):
+        """Tests that the prefork mode forks one process per worker"""
+        server = self._create_server(3, osquery.PREFORK_SERVER)
+        self.assertTrue(isinstance(server, TPreforkServer))
+        self.assertEqual(server.processes, 3)
+
+    def test_prefork_server_workers(self):
+        """Tests that the prefork mode honors a single worker"""
+        server = self._create_server(1, osquery.PREFORK_SERVER)
+        self.assertEqual(server.processes, 1)
+        server = self._create_server(None, osquery.PREFORK_SERVER)
+        self.assertEqual(server.processes, multiprocessing.cpu_count())
+        server = self._create_server(None)
+        self.assertTrue(isinstance(server, TServer.TSimpleServer))
+
+    def test_workers_flag(self):
+        """Tests that the worker count is parsed from the command line"""
+        argv = sys.argv
+        try:
+            sys.argv = ["extension", "--workers", "8"]
+            self.assertEqual(osquery.parse_cli_params().workers, 8)
+            sys.argv = ["extension"]
+            self.assertEqual(osquery.parse_cli_params().workers, None)
+        finally:
+            sys.argv = argv
+
+@unittest.skipIf(sys.platform == osquery.WINDOWS_PLATFORM,
+                 "The prefork server requires fork")
+class TestPreforkServer(unittest.TestCase):
+    """Tests for osquery.prefork_server.TPreforkServer"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "osquery.em")
+        self.server = TPreforkServer(
+            ExtensionProcessor(osquery.ExtensionManager()),
+            TSocket.TServerSocket(unix_socket=self.path),
+            TTransport.TBufferedTransportFactory(),
+            TBinaryProtocol.TBinaryProtocolFactory(),
+            processes=2,
+            restart_delay=0)
+        self.thread = threading.Thread(target=self.server.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.stop()
+        self.thread.join(5)
+        shutil.rmtree(self.directory)
+
+    def _ping(self):
+        client = osquery.ExtensionClient(path=self.path)
+        self.assertTrue(client.open(timeout=2, interval=0.05))
+        try:
+            return client.extension_client().ping().code
+        finally:
+            client.close()
+
+    def test_workers_serve_requests(self):
+        """Tests that forked workers answer requests on the shared socket"""
+        for _ in range(4):
+            self.assertEqual(self._ping(), 0)
+        self.assertEqual(len(self.server.children), 2)
+
+    def test_crashed_worker_is_restarted(self):
+        """Tests that the parent replaces a worker that crashed"""
+        self.assertEqual(self._ping(), 0)
+        crashed = next(iter(self.server.children))
+        os.kill(crashed, signal.SIGKILL)
+        delay = 0
+        while crashed in self.server.children and delay < 5:
+            time.sleep(0.05)
+            delay += 0.05
+        while len(self.server.children) < 2 and delay < 5:
+            time.sleep(0.05)
+            delay += 0.05
+        self.assertFalse(crashed in self.server.children)
+        self.assertEqual(len(self.server.children), 2)
+        self.assertEqual(self._ping(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+"""This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                "../build/lib/")))
+
+import osquery
+
+class MockProcessPoolTablePlugin(osquery.ProcessPoolTablePlugin):
+    """Mock table plugin generating its rows in worker processes"""
+    def name(self):
+        return "foobar_process_pool"
+
+    def columns(self):
+        return [
+            osquery.TableColumn(name="pid", type=osquery.INTEGER),
+            osquery.TableColumn(name="path", type=osquery.STRING),
+        ]
+
+    def generate(self, context):
+        paths = context.equals("path") or ["/"]
+        if "/fail" in paths:
+            raise ValueError("cannot generate /fail")
+        return [{"pid": os.getpid(), "path": path} for path in paths]
+
+class MockRecycledTablePlugin(osquery.ProcessPoolTablePlugin):
+    """Mock table plugin replacing its workers after every request"""
+
+    pool_max_rss = 1
+
+    def name(self):
+        return "foobar_recycled"
+
+    def columns(self):
+        return [osquery.TableColumn(name="pid", type=osquery.INTEGER)]
+
+    def generate(self, context):
+        return [{"pid": os.getpid()}]
+
+class MockStuckTablePlugin(osquery.ProcessPoolTablePlugin):
+    """Mock table plugin whose generate never finishes in time"""
+
+    deadline = 0.1
+    pool_processes = 1
+
+    def name(self):
+        return "foobar_stuck"
+
+    def columns(self):
+        return [osquery.TableColumn(name="pid", type=osquery.INTEGER)]
+
+    def generate(self, context):
+        time.sleep(60)
+        return [{"pid": os.getpid()}]
+
+def call(plugin, path):
+    """Generate the rows of a mock plugin for a path"""
+    context = {"constraints": [{
+        "name": "path",
+        "affinity": "TEXT",
+        "list": [{"op": osquery.EQUALS, "expr": path}],
+    }]}
+    return plugin.call({"action": "generate", "context": json.dumps(context)})
+
+@unittest.skipIf(sys.platform == "win32", "Worker processes require fork")
+class TestProcessPoolTablePlugin(unittest.TestCase):
+    """Tests for osquery.ProcessPoolTablePlugin"""
+
+    def tearDown(self):
+        MockProcessPoolTablePlugin().stop_pool()
+        MockRecycledTablePlugin().stop_pool()
+        MockStuckTablePlugin().stop_pool()
+
+    def test_generate_in_worker(self):
+        """Tests that rows are generated by a worker process"""
+        results = call(MockProcessPoolTablePlugin(), "/etc")
+        self.assertEqual(results.status.code, 0)
+        self.assertEqual(len(results.response), 1)
+        self.assertEqual(results.response[0]["path"], "/etc")
+        self.assertNotEqual(results.response[0]["pid"], str(os.getpid()))
+
+    def test_generate_failure(self):
+        """Tests that a failed generate is reported and the worker reused"""
+        plugin = MockProcessPoolTablePlugin()
+        results = call(plugin, "/fail")
+        self.assertEqual(results.status.code, 1)
+        self.assertEqual(results.status.message, "cannot generate /fail")
+        self.assertEqual(call(plugin, "/etc").status.code, 0)
+
+    def test_memory_recycling(self):
+        """Tests that workers above the memory threshold are replaced"""
+        plugin = MockRecycledTablePlugin()
+        pids = set()
+        for _ in range(plugin.pool_processes + 1):
+            pids.add(call(plugin, "/etc").response[0]["pid"])
+        self.assertEqual(len(pids), plugin.pool_processes + 1)
+
+    def test_deadline_kills_worker(self):
+        """Tests that a worker past the table deadline is replaced"""
+        plugin = MockStuckTablePlugin()
+        start = time.time()
+        results = plugin.call({"action": "generate"})
+        self.assertTrue(time.time() - start < 5)
+        self.assertEqual(results.status.code, 1)
+
+if __name__ == '__main__':
+    unittest.main()
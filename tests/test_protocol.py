@@ -0,0 +1,53 @@
+"""This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                "../build/lib/")))
+
+from thrift.protocol import TBinaryProtocol
+from thrift.transport import TTransport
+
+import osquery
+from osquery.extensions.ttypes import ExtensionResponse, ExtensionStatus
+from osquery.protocol import binary_protocol
+
+class TestProtocol(unittest.TestCase):
+    """Tests for osquery.protocol"""
+
+    def test_thrift_acceleration(self):
+        """Tests that the active encoding path is reported"""
+        acceleration = osquery.thrift_acceleration()
+        self.assertTrue(acceleration in (osquery.PROTOCOL_ACCELERATION,
+                                         osquery.ENCODER_ACCELERATION,
+                                         osquery.NO_ACCELERATION))
+        accelerated = isinstance(
+            binary_protocol(TTransport.TMemoryBuffer()),
+            TBinaryProtocol.TBinaryProtocolAccelerated)
+        self.assertEqual(accelerated,
+                         acceleration == osquery.PROTOCOL_ACCELERATION)
+
+    def test_selected_protocol_round_trip(self):
+        """Tests that the selected protocol encodes and decodes responses"""
+        response = ExtensionResponse(
+            status=ExtensionStatus(code=0, message="OK"),
+            response=[{"foo": "bar"}])
+        trans = TTransport.TMemoryBuffer()
+        response.write(binary_protocol(trans))
+        decoded = ExtensionResponse()
+        decoded.read(binary_protocol(
+            TTransport.TMemoryBuffer(trans.getvalue())))
+        self.assertEqual(decoded, response)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+"""This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                "../build/lib/")))
+
+import osquery
+
+CONTEXT = {
+    "constraints": [
+        {
+            "name": "path",
+            "affinity": "TEXT",
+            "list": [
+                {"op": osquery.EQUALS, "expr": "/etc/hosts"},
+                {"op": osquery.EQUALS, "expr": "/etc/passwd"},
+            ],
+        },
+        {
+            "name": "size",
+            "affinity": "BIGINT",
+            "list": [
+                {"op": osquery.GREATER_THAN, "expr": "10"},
+                {"op": osquery.GREATER_THAN_OR_EQUALS, "expr": "20"},
+                {"op": osquery.LESS_THAN, "expr": "100"},
+            ],
+        },
+        {"name": "mode", "affinity": "TEXT", "list": []},
+    ],
+}
+
+class MockContextTablePlugin(osquery.TablePlugin):
+    """Mock table plugin generating rows from its query context"""
+    def name(self):
+        return "foobar_context"
+
+    def columns(self):
+        return [osquery.TableColumn(name="path", type=osquery.STRING)]
+
+    def generate(self, context):
+        return [{"path": path} for path in sorted(context.equals("path"))]
+
+class TestQueryContext(unittest.TestCase):
+    """Tests for osquery.QueryContext"""
+
+    def test_context_is_a_dictionary(self):
+        """Tests that the raw context stays accessible"""
+        context = osquery.QueryContext(CONTEXT)
+        self.assertEqual(context["constraints"], CONTEXT["constraints"])
+        self.assertEqual(osquery.QueryContext(), {})
+
+    def test_constraints_for(self):
+        """Tests that constraints are converted to the column type"""
+        context = osquery.QueryContext(CONTEXT)
+        self.assertEqual(context.constraints_for("size", osquery.LESS_THAN),
+                         [100])
+        self.assertEqual(context.constraints_for("path"), [
+            (osquery.EQUALS, "/etc/hosts"),
+            (osquery.EQUALS, "/etc/passwd"),
+        ])
+        self.assertEqual(context.constraints_for("missing"), [])
+        self.assertEqual(sorted(context.constrained_columns()),
+                         ["path", "size"])
+
+    def test_unsigned_bigint_constraints(self):
+        """Tests that UNSIGNED BIGINT constraints are integers"""
+        context = osquery.QueryContext({"constraints": [
+            {"name": "size", "affinity": "UNSIGNED BIGINT",
+             "list": [{"op": osquery.GREATER_THAN, "expr": "9"}]},
+        ]})
+        self.assertEqual(context.constraints_for("size", osquery.GREATER_THAN),
+                         [9])
+
+    def test_equals(self):
+        """Tests that = and IN constraints become a set of values"""
+        context = osquery.QueryContext(CONTEXT)
+        self.assertEqual(context.equals("path"),
+                         set(["/etc/hosts", "/etc/passwd"]))
+        self.assertEqual(context.equals("size"), None)
+
+    def test_bounds(self):
+        """Tests that range constraints are narrowed to their bounds"""
+        context = osquery.QueryContext(CONTEXT)
+        self.assertEqual(context.bounds("size"), (20, 100))
+        self.assertEqual(context.bounds("path"), (None, None))
+
+    def test_columns_used(self):
+        """Tests that the columns used by the query are exposed"""
+        context = osquery.QueryContext({"colsUsed": ["path", "size"]})
+        self.assertEqual(context.columns_used(), set(["path", "size"]))
+        self.assertTrue(context.is_column_used("path"))
+        self.assertFalse(context.is_column_used("sha256"))
+        context = osquery.QueryContext(CONTEXT)
+        self.assertEqual(context.columns_used(), None)
+        self.assertTrue(context.is_column_used("sha256"))
+
+    def test_implies(self):
+        """Tests that narrower constraints imply broader ones"""
+        broad = osquery.QueryContext(CONTEXT)
+        narrow = osquery.QueryContext({"constraints": [
+            {"name": "path", "affinity": "TEXT",
+             "list": [{"op": osquery.EQUALS, "expr": "/etc/hosts"}]},
+            {"name": "size", "affinity": "BIGINT",
+             "list": [{"op": osquery.EQUALS, "expr": "50"}]},
+        ]})
+        self.assertTrue(narrow.implies(broad))
+        self.assertFalse(broad.implies(narrow))
+        self.assertTrue(broad.implies(osquery.QueryContext()))
+        self.assertFalse(osquery.QueryContext().implies(broad))
+        ranged = osquery.QueryContext({"constraints": [
+            {"name": "path", "affinity": "TEXT",
+             "list": [{"op": osquery.EQUALS, "expr": "/etc/passwd"}]},
+            {"name": "size", "affinity": "BIGINT",
+             "list": [{"op": osquery.GREATER_THAN, "expr": "20"},
+                      {"op": osquery.LESS_THAN_OR_EQUALS, "expr": "50"}]},
+        ]})
+        self.assertTrue(ranged.implies(broad))
+        liked = osquery.QueryContext({"constraints": [
+            {"name": "path", "affinity": "TEXT",
+             "list": [{"op": osquery.LIKE, "expr": "/etc/%"}]},
+        ]})
+        self.assertTrue(liked.implies(liked))
+        self.assertFalse(narrow.implies(liked))
+
+    def test_row_filter(self):
+        """Tests that rows are tested against the typed constraints"""
+        matches = osquery.QueryContext(CONTEXT).row_filter()
+        self.assertTrue(matches({"path": "/etc/hosts", "size": "50"}))
+        self.assertTrue(matches({"path": "/etc/hosts", "size": 20}))
+        self.assertFalse(matches({"path": "/etc/hosts", "size": "200"}))
+        self.assertFalse(matches({"path": "/etc/shadow", "size": "50"}))
+        # Values that cannot be compared are left to osquery core.
+        self.assertTrue(matches({"path": "/etc/hosts", "size": "large"}))
+        self.assertEqual(osquery.QueryContext().row_filter(), None)
+
+    def test_row_filter_affinities(self):
+        """Tests that only constraints of known affinities are tested"""
+        def size_filter(affinity):
+            return osquery.QueryContext({"constraints": [
+                {"name": "size", "affinity": affinity,
+                 "list": [{"op": osquery.GREATER_THAN, "expr": "9"}]},
+            ]}).row_filter()
+        matches = size_filter("UNSIGNED BIGINT")
+        self.assertTrue(matches({"size": "10"}))
+        self.assertTrue(matches({"size": "100"}))
+        self.assertFalse(matches({"size": "2"}))
+        self.assertEqual(size_filter("BLOB"), None)
+        self.assertEqual(size_filter("UNKNOWN"), None)
+
+    def test_generate_receives_context(self):
+        """Tests that generate receives the parsed query context"""
+        results = MockContextTablePlugin().call({
+            "action": "generate",
+            "context": json.dumps(CONTEXT),
+        })
+        self.assertEqual(results.response,
+                         [{"path": "/etc/hosts"}, {"path": "/etc/passwd"}])
+
+if __name__ == '__main__':
+    unittest.main()
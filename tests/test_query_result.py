@@ -0,0 +1,188 @@
+"""This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from array import array
+import math
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                "../build/lib/")))
+
+from thrift.Thrift import TApplicationException, TMessageType
+from thrift.protocol import TBinaryProtocol
+from thrift.transport import TTransport
+
+from osquery.extensions.ExtensionManager import Client, query_result
+from osquery.extensions.ttypes import ExtensionResponse, ExtensionStatus
+from osquery.query_result import ARRAY_COLUMNS, LIST_COLUMNS, \
+    NUMPY_COLUMNS, LazyRows, columnar_rows, read_query_reply
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+def query_reply(response):
+    """Encode the reply osquery core sends to a query"""
+    trans = TTransport.TMemoryBuffer()
+    oprot = TBinaryProtocol.TBinaryProtocol(trans)
+    oprot.writeMessageBegin("query", TMessageType.REPLY, 0)
+    query_result(success=response).write(oprot)
+    oprot.writeMessageEnd()
+    return trans.getvalue()
+
+def reply_protocol(payload):
+    """A protocol reading an encoded reply"""
+    return TBinaryProtocol.TBinaryProtocol(TTransport.TMemoryBuffer(payload))
+
+class TestQueryResult(unittest.TestCase):
+    """Tests for osquery.query_result"""
+
+    response = ExtensionResponse(
+        status=ExtensionStatus(code=0, message="OK"),
+        response=[{"name": "launchd", "pid": "1", "path": "/sbin/launchd"},
+                  {"pid": "2", "name": "café"},
+                  {"name": "kernel_task"}])
+
+    def test_rows_match_generated_code(self):
+        """Tests that lazy rows decode to the rows of the generated client"""
+        payload = query_reply(self.response)
+        expected = Client(reply_protocol(payload)).recv_query()
+        result = read_query_reply(reply_protocol(payload))
+        self.assertIsInstance(result.response, LazyRows)
+        self.assertEqual(result.status, expected.status)
+        self.assertEqual(result.response, expected.response)
+        self.assertEqual(result, expected)
+
+    def test_random_access(self):
+        """Tests indexing and slicing lazy rows"""
+        rows = read_query_reply(reply_protocol(
+            query_reply(self.response))).response
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1], {"pid": "2", "name": "café"})
+        self.assertEqual(rows[-1], {"name": "kernel_task"})
+        self.assertEqual(rows[::2], [self.response.response[0],
+                                     self.response.response[2]])
+        self.assertRaises(IndexError, lambda: rows[3])
+
+    def test_column(self):
+        """Tests decoding a single column"""
+        rows = read_query_reply(reply_protocol(
+            query_reply(self.response))).response
+        self.assertEqual(rows.column("name"),
+                         ["launchd", "café", "kernel_task"])
+        self.assertEqual(rows.column("pid", ""), ["1", "2", ""])
+        self.assertEqual(rows.column("missing"), [None, None, None])
+
+    def test_empty_and_failed_queries(self):
+        """Tests replies without rows"""
+        failed = ExtensionResponse(
+            status=ExtensionStatus(code=1, message="no such table: foo"),
+            response=[])
+        result = read_query_reply(reply_protocol(query_reply(failed)))
+        self.assertEqual(result.status.message, "no such table: foo")
+        self.assertEqual(len(result.response), 0)
+
+    def test_exception_reply(self):
+        """Tests that application exceptions are raised"""
+        trans = TTransport.TMemoryBuffer()
+        oprot = TBinaryProtocol.TBinaryProtocol(trans)
+        oprot.writeMessageBegin("query", TMessageType.EXCEPTION, 0)
+        TApplicationException(TApplicationException.INTERNAL_ERROR,
+                              "Internal error").write(oprot)
+        oprot.writeMessageEnd()
+        self.assertRaises(TApplicationException, read_query_reply,
+                          reply_protocol(trans.getvalue()))
+        self.assertRaises(TApplicationException, read_query_reply,
+                          reply_protocol(query_reply(None)))
+
+    def test_negative_sizes(self):
+        """Tests that negative lengths and truncated replies are rejected"""
+        header = b"\x80\x01\x00\x02\x00\x00\x00\x05query\x00\x00\x00\x00"
+        rows = b"\x0c\x00\x00\x0f\x00\x02\x0d"
+        for payload in (
+                b"\x0c\x00\x00\x0b\x00\x09\xff\xff\xff\xf9",
+                rows + b"\xff\xff\xff\xff",
+                rows + b"\x00\x00\x00\x01\x0b\x0b\xff\xff\xff\xff",
+                rows + b"\x00\x00\x00\x01\x0b\x0b\x00\x00\x00\x01"
+                b"\xff\xff\xff\xf0",
+                rows + b"\x00\x00\x00\x01"):
+            self.assertRaises(TTransport.TTransportException,
+                              read_query_reply,
+                              reply_protocol(header + payload))
+
+class TestColumnarRows(unittest.TestCase):
+    """Tests for osquery.query_result.columnar_rows"""
+
+    columns = [("pid", "BIGINT"), ("name", "TEXT"), ("uid", "INTEGER"),
+               ("inode", "UNSIGNED BIGINT"), ("load", "DOUBLE")]
+
+    def setUp(self):
+        response = ExtensionResponse(
+            status=ExtensionStatus(code=0, message="OK"),
+            response=[{"pid": "1", "name": "launchd", "uid": "0",
+                       "inode": "18446744073709551615", "load": "0.5"},
+                      {"pid": "", "name": "café", "uid": "-2",
+                       "inode": "7", "load": "nan?"}])
+        self.rows = read_query_reply(reply_protocol(
+            query_reply(response))).response
+
+    def test_lists(self):
+        """Tests that numeric columns are parsed and NULLs are None"""
+        result = columnar_rows(self.rows, self.columns, LIST_COLUMNS)
+        self.assertEqual(list(result), ["pid", "name", "uid", "inode",
+                                        "load"])
+        self.assertEqual(result["pid"], [1, None])
+        self.assertEqual(result["name"], ["launchd", "café"])
+        self.assertEqual(result["uid"], [0, -2])
+        self.assertEqual(result["inode"], [2 ** 64 - 1, 7])
+        self.assertEqual(result["load"], [0.5, None])
+
+    def test_arrays(self):
+        """Tests that numeric columns are arrays and NULLs are filled"""
+        result = columnar_rows(self.rows, self.columns, ARRAY_COLUMNS)
+        self.assertIsInstance(result["pid"], array)
+        self.assertEqual(list(result["pid"]), [1, 0])
+        self.assertEqual(result["name"], ["launchd", "café"])
+        self.assertEqual(list(result["inode"]), [2 ** 64 - 1, 7])
+        self.assertEqual(result["load"][0], 0.5)
+        self.assertTrue(math.isnan(result["load"][1]))
+        self.assertRaises(ValueError, columnar_rows, self.rows, self.columns,
+                          "frame")
+
+    def test_out_of_range_integers(self):
+        """Tests that integers out of an array type's range are filled"""
+        response = ExtensionResponse(
+            status=ExtensionStatus(code=0, message="OK"),
+            response=[{"inode": "-1", "pid": str(2 ** 63)},
+                      {"inode": str(2 ** 64), "pid": "7"},
+                      {"inode": "3", "pid": "-7"}])
+        rows = read_query_reply(reply_protocol(
+            query_reply(response))).response
+        columns = [("inode", "UNSIGNED BIGINT"), ("pid", "BIGINT")]
+        result = columnar_rows(rows, columns, ARRAY_COLUMNS)
+        self.assertEqual(list(result["inode"]), [0, 0, 3])
+        self.assertEqual(list(result["pid"]), [0, 7, -7])
+        result = columnar_rows(rows, columns, LIST_COLUMNS)
+        self.assertEqual(result["inode"], [-1, 2 ** 64, 3])
+
+    @unittest.skipIf(numpy is None, "Requires NumPy")
+    def test_numpy(self):
+        """Tests decoding into a NumPy structured array"""
+        result = columnar_rows(self.rows, self.columns, NUMPY_COLUMNS)
+        self.assertEqual(result.dtype["pid"], numpy.dtype("i8"))
+        self.assertEqual(result.dtype["inode"], numpy.dtype("u8"))
+        self.assertEqual(list(result["uid"]), [0, -2])
+        self.assertEqual(list(result["name"]), ["launchd", "café"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+"""This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                "../build/lib/")))
+
+from thrift.protocol import TBinaryProtocol
+from thrift.transport import TTransport
+
+import osquery
+from osquery.extensions.Extension import Client
+from osquery.extensions.ttypes import ExtensionResponse, ExtensionStatus
+from osquery.processor import ExtensionProcessor
+from osquery.response import EncodedExtensionResponse, encode_response, \
+    _encode_response
+
+class MockEncodedTablePlugin(osquery.TablePlugin):
+    """Mock table plugin caching encoded responses"""
+
+    cache_ttl = 60
+    cache_encoded = True
+
+    def name(self):
+        return "foobar_encoded"
+
+    def columns(self):
+        return [osquery.TableColumn(name="foo", type=osquery.STRING)]
+
+    def generate(self, context):
+        return [{"foo": "bar"}, {"foo": "baz"}]
+
+def call_reply(processor, registry, item, request):
+    """Send a call through a processor and return the reply bytes"""
+    itrans = TTransport.TMemoryBuffer()
+    Client(TBinaryProtocol.TBinaryProtocol(itrans)).send_call(
+        registry, item, request)
+    otrans = TTransport.TMemoryBuffer()
+    processor.process(
+        TBinaryProtocol.TBinaryProtocol(
+            TTransport.TMemoryBuffer(itrans.getvalue())),
+        TBinaryProtocol.TBinaryProtocol(otrans))
+    return otrans.getvalue()
+
+class TestResponse(unittest.TestCase):
+    """Tests for osquery.response"""
+
+    def test_encode_matches_generated_code(self):
+        """Tests that responses are encoded like the generated code does"""
+        responses = [
+            ExtensionResponse(
+                status=ExtensionStatus(code=0, message="OK", uuid=2 ** 40),
+                response=[{"foo": "bar", "caf\u00e9": "\u00e9t\u00e9"}, {}]),
+            ExtensionResponse(
+                status=ExtensionStatus(code=1, message="Failed"),
+                response=[]),
+            ExtensionResponse(status=ExtensionStatus(code=0)),
+        ]
+        for response in responses:
+            trans = TTransport.TMemoryBuffer()
+            response.write(TBinaryProtocol.TBinaryProtocol(trans))
+            self.assertEqual(encode_response(response), trans.getvalue())
+            self.assertEqual(_encode_response(response), trans.getvalue())
+
+    def test_encoded_response_decodes_lazily(self):
+        """Tests that an encoded response decodes to the original"""
+        response = ExtensionResponse(
+            status=ExtensionStatus(code=0, message="OK"),
+            response=[{"foo": "bar"}])
+        encoded = EncodedExtensionResponse(encode_response(response))
+        self.assertEqual(encoded.status, response.status)
+        self.assertEqual(encoded.response, response.response)
+        self.assertEqual(encoded, response)
+
+    def test_processor_writes_encoded_response(self):
+        """Tests that encoded responses are written as regular replies"""
+        ext_manager = osquery.ExtensionManager()
+        ext_manager.add_plugin(MockEncodedTablePlugin)
+        processor = ExtensionProcessor(ext_manager)
+        request = {"action": "generate"}
+        first = call_reply(processor, "table", "foobar_encoded", request)
+        second = call_reply(processor, "table", "foobar_encoded", request)
+        self.assertEqual(first, second)
+
+        client = Client(TBinaryProtocol.TBinaryProtocol(
+            TTransport.TMemoryBuffer(second)))
+        results = client.recv_call()
+        self.assertEqual(results.status.code, 0)
+        self.assertEqual(results.response, [{"foo": "bar"}, {"foo": "baz"}])
+
+    def test_encoded_cache_hit(self):
+        """Tests that the cache stores the encoded response"""
+        plugin = MockEncodedTablePlugin()
+        plugin.call({"action": "generate"})
+        results = plugin.call({"action": "generate"})
+        self.assertTrue(isinstance(results, EncodedExtensionResponse))
+        self.assertEqual(results.response, [{"foo": "bar"}, {"foo": "baz"}])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,295 @@
+"""This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                "../build/lib/")))
+
+import osquery
+from osquery.table_cache import TableCache, context_key
+
+def path_context(*paths):
+    """A query context constraining the path column"""
+    return {
+        "constraints": [{
+            "name": "path",
+            "affinity": "TEXT",
+            "list": [{"op": osquery.EQUALS, "expr": path} for path in paths],
+        }],
+    }
+
+class MockCachedTablePlugin(osquery.TablePlugin):
+    """Mock table plugin with a response cache"""
+
+    cache_ttl = 60
+    generated = 0
+
+    def name(self):
+        return "foobar_cached"
+
+    def columns(self):
+        return [osquery.TableColumn(name="path", type=osquery.STRING,
+                                    options=osquery.INDEX)]
+
+    def generate(self, context):
+        MockCachedTablePlugin.generated += 1
+        return [{"path": path} for path in sorted(context.equals("path"))]
+
+class MockStaleTablePlugin(osquery.TablePlugin):
+    """Mock table plugin serving stale responses while refreshing"""
+
+    cache_ttl = 0.01
+    cache_max_stale = 60
+    generated = 0
+
+    def name(self):
+        return "foobar_stale"
+
+    def columns(self):
+        return [osquery.TableColumn(name="value", type=osquery.INTEGER)]
+
+    def generate(self, context):
+        value = MockStaleTablePlugin.generated
+        MockStaleTablePlugin.generated += 1
+        return [{"value": value}]
+
+class MockPartialRefreshTablePlugin(osquery.TablePlugin):
+    """Mock table plugin whose refreshes exceed its budget"""
+
+    cache_ttl = 0.01
+    cache_max_stale = 60
+    max_rows = 1
+    truncate_results = True
+    generated = 0
+
+    def name(self):
+        return "foobar_partial_refresh"
+
+    def columns(self):
+        return [osquery.TableColumn(name="value", type=osquery.INTEGER)]
+
+    def generate(self, context):
+        MockPartialRefreshTablePlugin.generated += 1
+        if MockPartialRefreshTablePlugin.generated == 1:
+            return [{"value": 0}]
+        return [{"value": 1}, {"value": 2}]
+
+class MockSubsumingTablePlugin(osquery.TablePlugin):
+    """Mock table plugin answering narrower queries from its cache"""
+
+    cache_ttl = 60
+    cache_subsume = True
+    generated = 0
+
+    def name(self):
+        return "foobar_subsuming"
+
+    def columns(self):
+        return [
+            osquery.TableColumn(name="path", type=osquery.STRING,
+                                options=osquery.INDEX),
+            osquery.TableColumn(name="size", type=osquery.INTEGER),
+        ]
+
+    def generate(self, context):
+        MockSubsumingTablePlugin.generated += 1
+        paths = context.equals("path") or ["/a", "/b", "/c"]
+        return [{"path": path, "size": len(path) * 10} for path in paths]
+
+class MockAdditionalTablePlugin(osquery.TablePlugin):
+    """Mock table plugin adding a row for each constrained path"""
+
+    cache_ttl = 60
+    cache_subsume = True
+
+    def name(self):
+        return "foobar_additional"
+
+    def columns(self):
+        return [
+            osquery.TableColumn(name="path", type=osquery.STRING,
+                                options=osquery.INDEX | osquery.ADDITIONAL),
+            osquery.TableColumn(name="pid", type=osquery.INTEGER),
+        ]
+
+    def generate(self, context):
+        paths = context.equals("path") or ["/default"]
+        return [{"path": path, "pid": 5} for path in paths]
+
+class TestTableCache(unittest.TestCase):
+    """Tests for osquery.table_cache.TableCache"""
+
+    def test_context_key(self):
+        """Tests that equivalent contexts share a key"""
+        first = osquery.QueryContext(path_context("/a", "/b"))
+        second = osquery.QueryContext(path_context("/b", "/a"))
+        third = osquery.QueryContext(path_context("/a"))
+        self.assertEqual(context_key(first), context_key(second))
+        self.assertNotEqual(context_key(first), context_key(third))
+
+    def test_least_recently_used_eviction(self):
+        """Tests that the least recently used entry is evicted"""
+        cache = TableCache(60, max_entries=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_byte_limit(self):
+        """Tests that entries are evicted to stay under the byte limit"""
+        cache = TableCache(60, max_bytes=10)
+        cache.put("a", 1, 6)
+        cache.put("b", 2, 6)
+        cache.put("c", 3, 11)
+        self.assertEqual(cache.get("a"), None)
+        self.assertEqual(cache.get("b"), 2)
+        self.assertEqual(cache.get("c"), None)
+        self.assertEqual(cache.stats()["bytes"], 6)
+
+    def test_expiry(self):
+        """Tests that entries expire after the time to live"""
+        cache = TableCache(0.01)
+        cache.put("a", 1)
+        time.sleep(0.02)
+        self.assertEqual(cache.get("a"), None)
+        self.assertEqual(cache.stats()["misses"], 1)
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_stale_while_revalidate(self):
+        """Tests that one caller refreshes a stale entry"""
+        cache = TableCache(0.01, max_stale=60)
+        cache.put("a", 1)
+        time.sleep(0.02)
+        self.assertEqual(cache.lookup("a"), (1, True))
+        self.assertEqual(cache.lookup("a"), (1, False))
+        cache.abandon_refresh("a")
+        self.assertEqual(cache.lookup("a"), (1, True))
+        cache.put("a", 2)
+        self.assertEqual(cache.lookup("a"), (2, False))
+        self.assertEqual(cache.stats()["stale_hits"], 3)
+
+    def test_stale_plugin_refresh(self):
+        """Tests that a stale response is served and refreshed"""
+        plugin = MockStaleTablePlugin()
+        request = {"action": "generate"}
+        self.assertEqual(plugin.call(request).response, [{"value": "0"}])
+        time.sleep(0.02)
+        self.assertEqual(plugin.call(request).response, [{"value": "0"}])
+        # Wait for the background refresh to replace the stale entry.
+        response = [{"value": "0"}]
+        delay = 0
+        while response == [{"value": "0"}] and delay < 5:
+            time.sleep(0.01)
+            delay += 0.01
+            response = plugin.call(request).response
+        self.assertNotEqual(response, [{"value": "0"}])
+        self.assertTrue(plugin.cache_stats()["stale_hits"] >= 1)
+
+    def test_partial_refresh_is_abandoned(self):
+        """Tests that an uncached refresh lets a later one start"""
+        plugin = MockPartialRefreshTablePlugin()
+        request = {"action": "generate"}
+        self.assertEqual(plugin.call(request).response, [{"value": "0"}])
+        for generated in (2, 3):
+            time.sleep(0.02)
+            self.assertEqual(plugin.call(request).response, [{"value": "0"}])
+            delay = 0
+            while MockPartialRefreshTablePlugin.generated < generated and \
+                    delay < 5:
+                time.sleep(0.01)
+                delay += 0.01
+            self.assertEqual(MockPartialRefreshTablePlugin.generated,
+                             generated)
+            # The refresh thread abandons the key after generating.
+            delay = 0
+            while plugin._table_cache()._refreshing and delay < 5:
+                time.sleep(0.01)
+                delay += 0.01
+            self.assertEqual(plugin._table_cache()._refreshing, set())
+
+    def test_cached_plugin(self):
+        """Tests that a cache hit skips generate"""
+        plugin = MockCachedTablePlugin()
+        request = {
+            "action": "generate",
+            "context": json.dumps(path_context("/cached")),
+        }
+        generated = MockCachedTablePlugin.generated
+        first = plugin.call(request)
+        hits = plugin.cache_stats()["hits"]
+        second = plugin.call(request)
+        self.assertEqual(first.response, [{"path": "/cached"}])
+        self.assertEqual(second.response, [{"path": "/cached"}])
+        self.assertEqual(MockCachedTablePlugin.generated, generated + 1)
+        self.assertEqual(plugin.cache_stats()["hits"], hits + 1)
+
+    def test_subsumed_plugin(self):
+        """Tests that a narrower query is answered from a broader one"""
+        plugin = MockSubsumingTablePlugin()
+        generated = MockSubsumingTablePlugin.generated
+        plugin.call({"action": "generate",
+                     "context": json.dumps(path_context("/a", "/bb", "/c"))})
+        results = plugin.call({
+            "action": "generate",
+            "context": json.dumps(path_context("/c", "/a")),
+        })
+        self.assertEqual(sorted(row["path"] for row in results.response),
+                         ["/a", "/c"])
+        context = path_context("/bb")
+        context["constraints"].append({
+            "name": "size",
+            "affinity": "INTEGER",
+            "list": [{"op": osquery.GREATER_THAN, "expr": "25"}],
+        })
+        context["colsUsed"] = ["path", "size"]
+        results = plugin.call({"action": "generate",
+                               "context": json.dumps(context)})
+        self.assertEqual(results.response, [{"path": "/bb", "size": "30"}])
+        self.assertEqual(MockSubsumingTablePlugin.generated, generated + 1)
+        self.assertEqual(plugin.cache_stats()["subsumed_hits"], 2)
+        # A broader query must still be generated.
+        plugin.call({"action": "generate",
+                     "context": json.dumps(path_context("/a", "/d"))})
+        self.assertEqual(MockSubsumingTablePlugin.generated, generated + 2)
+
+    def test_additional_columns_are_not_subsumed(self):
+        """Tests that queries adding rows are generated"""
+        plugin = MockAdditionalTablePlugin()
+        results = plugin.call({"action": "generate"})
+        self.assertEqual(results.response, [{"path": "/default", "pid": "5"}])
+        results = plugin.call({"action": "generate",
+                               "context": json.dumps(path_context("/x"))})
+        self.assertEqual(results.response, [{"path": "/x", "pid": "5"}])
+
+    def test_unconverted_equality_is_subsumed(self):
+        """Tests that equality values of another type are filtered"""
+        plugin = MockAdditionalTablePlugin()
+        plugin.call({"action": "generate"})
+        context = {"constraints": [{
+            "name": "pid",
+            "affinity": "INTEGER",
+            "list": [{"op": osquery.EQUALS, "expr": "5.0"}],
+        }]}
+        results = plugin.call({"action": "generate",
+                               "context": json.dumps(context)})
+        self.assertEqual(results.response, [{"path": "/default", "pid": "5"}])
+        self.assertTrue(plugin.cache_stats()["subsumed_hits"] >= 1)
+
+if __name__ == '__main__':
+    unittest.main()
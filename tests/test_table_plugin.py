@@ -8,8 +8,11 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import array
+import json
 import os
 import sys
+import time
 import unittest
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
@@ -17,6 +20,11 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
 
 import osquery
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 class MockTablePlugin(osquery.TablePlugin):
     """Mock table plugin for testing the table API"""
     def name(self):
@@ -41,6 +49,233 @@ class MockTablePlugin(osquery.TablePlugin):
 
         return query_data
 
+class MockGeneratorTablePlugin(osquery.TablePlugin):
+    """Mock table plugin yielding its rows"""
+    def name(self):
+        return "foobar_generator"
+
+    def columns(self):
+        return [
+            osquery.TableColumn(name="foo", type=osquery.STRING),
+            osquery.TableColumn(name="int", type=osquery.INTEGER),
+        ]
+
+    def generate(self, context):
+        for i in range(3):
+            yield {"foo": "bar", "int": i}
+
+class MockTypedTablePlugin(osquery.TablePlugin):
+    """Mock table plugin using every column type"""
+    def name(self):
+        return "foobar_typed"
+
+    def columns(self):
+        return [
+            osquery.TableColumn(name="text", type=osquery.STRING),
+            osquery.TableColumn(name="int", type=osquery.INTEGER),
+            osquery.TableColumn(name="bigint", type=osquery.BIGINT),
+            osquery.TableColumn(name="double", type=osquery.DOUBLE),
+        ]
+
+    def generate(self, context):
+        return [
+            {"text": 1, "int": 42, "bigint": 2 ** 40, "double": 0.1},
+            {"text": "a", "int": "7", "bigint": 1.5, "double": 3},
+        ]
+
+class MockColumnarTablePlugin(osquery.TablePlugin):
+    """Mock table plugin returning its rows as columns"""
+    def name(self):
+        return "foobar_columnar"
+
+    def columns(self):
+        return [
+            osquery.TableColumn(name="foo", type=osquery.STRING),
+            osquery.TableColumn(name="int", type=osquery.INTEGER),
+            osquery.TableColumn(name="double", type=osquery.DOUBLE),
+        ]
+
+    def generate(self, context):
+        return {
+            "foo": ["bar", "baz"],
+            "int": array.array("q", [1, 2]),
+            "double": (0.5, 1.5),
+        }
+
+class MockOptionsTablePlugin(osquery.TablePlugin):
+    """Mock table plugin declaring column options"""
+    def name(self):
+        return "foobar_options"
+
+    def columns(self):
+        return [
+            osquery.TableColumn(name="path", type=osquery.STRING,
+                                options=osquery.INDEX | osquery.REQUIRED),
+            osquery.TableColumn("hash", osquery.STRING, osquery.HIDDEN),
+            osquery.TableColumn(name="size", type=osquery.BIGINT),
+        ]
+
+    def generate(self, context):
+        return []
+
+class MockFanoutTablePlugin(osquery.TablePlugin):
+    """Mock table plugin generating each host of an IN list in parallel"""
+
+    fanout_column = "host"
+
+    def name(self):
+        return "foobar_fanout"
+
+    def columns(self):
+        return [
+            osquery.TableColumn(name="host", type=osquery.STRING,
+                                options=osquery.INDEX),
+            osquery.TableColumn(name="up", type=osquery.INTEGER),
+        ]
+
+    def generate(self, context):
+        hosts = context.equals("host")
+        if len(hosts) == 1:
+            time.sleep(0.2)
+        return [{"host": host, "up": 1} for host in hosts]
+
+def count_slowly():
+    """Yield rows forever, one every 10 milliseconds"""
+    i = 0
+    while True:
+        time.sleep(0.01)
+        yield {"foo": i}
+        i += 1
+
+class MockDeadlineTablePlugin(osquery.TablePlugin):
+    """Mock table plugin yielding rows until its deadline"""
+
+    deadline = 0.1
+
+    def name(self):
+        return "foobar_deadline"
+
+    def columns(self):
+        return [osquery.TableColumn(name="foo", type=osquery.INTEGER)]
+
+    def generate(self, context):
+        return count_slowly()
+
+class MockPartialTablePlugin(osquery.TablePlugin):
+    """Mock table plugin returning the rows yielded before its deadline"""
+
+    deadline = 0.1
+    partial_results = True
+
+    def name(self):
+        return "foobar_partial"
+
+    def columns(self):
+        return [osquery.TableColumn(name="foo", type=osquery.INTEGER)]
+
+    def generate(self, context):
+        return count_slowly()
+
+class MockBudgetTablePlugin(osquery.TablePlugin):
+    """Mock table plugin yielding more rows than its budget"""
+
+    max_rows = 5
+
+    def name(self):
+        return "foobar_budget"
+
+    def columns(self):
+        return [osquery.TableColumn(name="foo", type=osquery.INTEGER)]
+
+    def generate(self, context):
+        return count_slowly()
+
+class MockTruncatedTablePlugin(osquery.TablePlugin):
+    """Mock table plugin truncating its rows to its byte budget"""
+
+    max_response_bytes = 30
+    truncate_results = True
+
+    def name(self):
+        return "foobar_truncated"
+
+    def columns(self):
+        return [osquery.TableColumn(name="foo", type=osquery.INTEGER)]
+
+    def generate(self, context):
+        return [{"foo": i} for i in range(100)]
+
+class MockSlotsRow(object):
+    """Mock row type with a slot for each column"""
+    __slots__ = ("foo", "int")
+
+    def __init__(self, foo, int_value):
+        self.foo = foo
+        self.int = int_value
+
+class MockTupleTablePlugin(osquery.TablePlugin):
+    """Mock table plugin generating tuple and __slots__ rows"""
+    def name(self):
+        return "foobar_tuple"
+
+    def columns(self):
+        return [
+            osquery.TableColumn(name="foo", type=osquery.STRING),
+            osquery.TableColumn(name="int", type=osquery.INTEGER),
+        ]
+
+    def generate(self, context):
+        yield ("bar", 1)
+        yield ("baz",)
+        yield MockSlotsRow("boo", 3)
+
+class MockListTablePlugin(osquery.TablePlugin):
+    """Mock table plugin returning list rows"""
+    def name(self):
+        return "foobar_list"
+
+    def columns(self):
+        return [
+            osquery.TableColumn(name="foo", type=osquery.STRING),
+            osquery.TableColumn(name="int", type=osquery.INTEGER),
+        ]
+
+    def generate(self, context):
+        return [["x", 1], ["y", 2]]
+
+PERSISTENT_ROWS = [{"a": 1, "b": "x"}, {"a": 2, "b": "y"}, {"a": 3, "b": "z"}]
+
+class MockPersistentTablePlugin(osquery.TablePlugin):
+    """Mock table plugin returning a list it keeps"""
+    def name(self):
+        return "foobar_persistent"
+
+    def columns(self):
+        return [
+            osquery.TableColumn(name="a", type=osquery.INTEGER),
+            osquery.TableColumn(name="b", type=osquery.STRING),
+        ]
+
+    def generate(self, context):
+        return PERSISTENT_ROWS
+
+class MockCachedPersistentTablePlugin(osquery.TablePlugin):
+    """Mock table plugin caching a list it keeps"""
+
+    cache_ttl = 60
+
+    def name(self):
+        return "foobar_cached_persistent"
+
+    def columns(self):
+        return [
+            osquery.TableColumn(name="a", type=osquery.INTEGER),
+            osquery.TableColumn(name="b", type=osquery.STRING),
+        ]
+
+    def generate(self, context):
+        return PERSISTENT_ROWS
+
 class TestTablePlugin(unittest.TestCase):
     """Tests for osquery.TablePlugin"""
 
@@ -77,6 +312,12 @@ class TestTablePlugin(unittest.TestCase):
         mtp = MockTablePlugin()
         self.assertEqual(expected, mtp.routes())
 
+    def test_column_options_routes(self):
+        """Tests that column options are broadcasted in the routes"""
+        plugin = MockOptionsTablePlugin()
+        self.assertEqual([route["op"] for route in plugin.routes()],
+                         ["3", "16", "0"])
+
     def test_simple_call(self):
         """Tests for the call method of osquery.TablePlugin"""
         ext_manager = osquery.ExtensionManager()
@@ -95,5 +336,260 @@ class TestTablePlugin(unittest.TestCase):
         ]
         self.assertEqual(results.response, expected)
 
+    def test_generator_call(self):
+        """Tests that generate may yield its rows"""
+        ext_manager = osquery.ExtensionManager()
+        ext_manager.add_plugin(MockGeneratorTablePlugin)
+        results = ext_manager.call("table", "foobar_generator",
+                                   {"action": "generate"})
+        expected = [
+            {"foo": "bar", "int": "0"},
+            {"foo": "bar", "int": "1"},
+            {"foo": "bar", "int": "2"},
+        ]
+        self.assertEqual(results.status.code, 0)
+        self.assertEqual(results.response, expected)
+
+    def test_column_converters(self):
+        """Tests that values are converted according to the column type"""
+        results = MockTypedTablePlugin().call({"action": "generate"})
+        expected = [
+            {"text": "1", "int": "42", "bigint": "1099511627776",
+             "double": "0.1"},
+            {"text": "a", "int": "7", "bigint": "1.5", "double": "3"},
+        ]
+        self.assertEqual(results.response, expected)
+
+    def test_columnar_call(self):
+        """Tests that generate may return a mapping of columns"""
+        results = MockColumnarTablePlugin().call({"action": "generate"})
+        expected = [
+            {"foo": "bar", "int": "1", "double": "0.5"},
+            {"foo": "baz", "int": "2", "double": "1.5"},
+        ]
+        self.assertEqual(results.status.code, 0)
+        self.assertEqual(results.response, expected)
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_numpy_columnar_call(self):
+        """Tests that NumPy columns are converted"""
+        plugin = MockColumnarTablePlugin()
+        results = plugin._generate_response({
+            "foo": numpy.array(["bar", "baz"]),
+            "int": numpy.arange(2),
+        }, osquery.QueryContext())
+        expected = [
+            {"foo": "bar", "int": "0"},
+            {"foo": "baz", "int": "1"},
+        ]
+        self.assertEqual(results.response, expected)
+
+    def test_columnar_length_mismatch(self):
+        """Tests that columns of different lengths are reported"""
+        plugin = MockColumnarTablePlugin()
+        results = plugin._generate_response({"foo": ["bar"], "int": []},
+                                            osquery.QueryContext())
+        self.assertEqual(results.status.code, 1)
+        self.assertEqual(results.response, [])
+
+    def test_unused_columns_are_dropped(self):
+        """Tests that columns missing from colsUsed are not returned"""
+        context = json.dumps({"colsUsed": ["int", "foo"]})
+        for plugin in (MockTypedTablePlugin(), MockColumnarTablePlugin()):
+            results = plugin.call({"action": "generate", "context": context})
+            for row in results.response:
+                self.assertTrue(set(row) <= set(["int", "foo"]))
+                self.assertTrue("int" in row)
+
+    def test_generated_list_is_not_modified(self):
+        """Tests that the list returned by generate is left as it was"""
+        expected = [dict(row) for row in PERSISTENT_ROWS]
+        plugin = MockPersistentTablePlugin()
+        results = plugin.call({"action": "generate",
+                               "context": json.dumps({"colsUsed": ["a"]})})
+        self.assertEqual(results.response,
+                         [{"a": "1"}, {"a": "2"}, {"a": "3"}])
+        self.assertEqual(PERSISTENT_ROWS, expected)
+
+    def test_rows_are_filtered(self):
+        """Tests that rows which cannot match the constraints are dropped"""
+        def call(plugin, name, affinity, op, expr):
+            context = {"constraints": [{
+                "name": name,
+                "affinity": affinity,
+                "list": [{"op": op, "expr": expr}],
+            }]}
+            return plugin.call({
+                "action": "generate",
+                "context": json.dumps(context),
+            }).response
+
+        typed = MockTypedTablePlugin()
+        rows = call(typed, "int", "INTEGER", osquery.GREATER_THAN, "10")
+        self.assertEqual([row["int"] for row in rows], ["42"])
+        rows = call(typed, "int", "INTEGER", osquery.EQUALS, "7")
+        self.assertEqual([row["int"] for row in rows], ["7"])
+        rows = call(typed, "text", "TEXT", osquery.EQUALS, "1")
+        self.assertEqual([row["text"] for row in rows], ["1"])
+        rows = call(typed, "text", "TEXT", osquery.LIKE, "A%")
+        self.assertEqual([row["text"] for row in rows], ["a"])
+        # Constraints on undeclared columns are left to osquery core.
+        rows = call(typed, "other", "TEXT", osquery.EQUALS, "x")
+        self.assertEqual(len(rows), 2)
+        rows = call(MockGeneratorTablePlugin(), "foo", "TEXT",
+                    osquery.LIKE, "_ar")
+        self.assertEqual(len(rows), 3)
+
+    def test_filtered_list_is_not_modified(self):
+        """Tests that filtering leaves the generated and cached lists alone"""
+        expected = [dict(row) for row in PERSISTENT_ROWS]
+        filtered = json.dumps({
+            "colsUsed": ["a"],
+            "constraints": [{
+                "name": "a",
+                "affinity": "INTEGER",
+                "list": [{"op": osquery.EQUALS, "expr": "2"}],
+            }],
+        })
+        for plugin in (MockPersistentTablePlugin(),
+                       MockCachedPersistentTablePlugin()):
+            results = plugin.call({"action": "generate",
+                                   "context": filtered})
+            self.assertEqual(results.response, [{"a": "2"}])
+            self.assertEqual(PERSISTENT_ROWS, expected)
+            results = plugin.call({"action": "generate"})
+            self.assertEqual(len(results.response), 3)
+            results = plugin.call({"action": "generate",
+                                   "context": filtered})
+            self.assertEqual(results.response, [{"a": "2"}])
+        self.assertEqual(PERSISTENT_ROWS, expected)
+
+    def test_fanout_call(self):
+        """Tests that IN list values are generated in parallel"""
+        context = {"constraints": [{
+            "name": "host",
+            "affinity": "TEXT",
+            "list": [{"op": osquery.EQUALS, "expr": host}
+                     for host in ("a", "b", "c", "d", "b")],
+        }]}
+        start = time.time()
+        results = MockFanoutTablePlugin().call({
+            "action": "generate",
+            "context": json.dumps(context),
+        })
+        self.assertTrue(time.time() - start < 0.6)
+        self.assertEqual(results.response, [
+            {"host": host, "up": "1"} for host in ("a", "b", "c", "d")])
+
+    def test_tuple_rows(self):
+        """Tests that tuple and object rows are mapped to the columns"""
+        plugin = MockTupleTablePlugin()
+        results = plugin.call({"action": "generate"})
+        self.assertEqual(results.response, [
+            {"foo": "bar", "int": "1"},
+            {"foo": "baz"},
+            {"foo": "boo", "int": "3"},
+        ])
+        context = {
+            "colsUsed": ["int"],
+            "constraints": [{
+                "name": "int",
+                "affinity": "INTEGER",
+                "list": [{"op": osquery.GREATER_THAN, "expr": "2"}],
+            }],
+        }
+        results = plugin.call({"action": "generate",
+                               "context": json.dumps(context)})
+        # The row without an int value is left to osquery core.
+        self.assertEqual(results.response, [{}, {"int": "3"}])
+
+    def test_list_rows(self):
+        """Tests that list rows are mapped to the columns"""
+        plugin = MockListTablePlugin()
+        results = plugin.call({"action": "generate"})
+        self.assertEqual(results.status.code, 0)
+        self.assertEqual(results.response, [
+            {"foo": "x", "int": "1"},
+            {"foo": "y", "int": "2"},
+        ])
+
+    def test_invalid_rows(self):
+        """Tests that rows of an unknown type fail the call"""
+        plugin = MockListTablePlugin()
+        for rows in (["xy"], [object()]):
+            plugin.generate = lambda context, rows=rows: rows
+            try:
+                results = plugin.call({"action": "generate"})
+            finally:
+                del plugin.generate
+            self.assertEqual(results.status.code, 1)
+            self.assertEqual(results.response, [])
+            self.assertTrue(results.status.message.startswith(
+                "Table rows cannot be of type"))
+
+    def test_deadline(self):
+        """Tests that generating stops at the deadline"""
+        start = time.time()
+        results = MockDeadlineTablePlugin().call({"action": "generate"})
+        self.assertTrue(time.time() - start < 1)
+        self.assertEqual(results.status.code, 1)
+        self.assertEqual(results.response, [])
+        results = MockPartialTablePlugin().call({"action": "generate"})
+        self.assertEqual(results.status.code, 0)
+        self.assertNotEqual(results.status.message, "OK")
+        self.assertTrue(len(results.response) > 0)
+        self.assertEqual(results.response[0], {"foo": "0"})
+
+    def test_budget(self):
+        """Tests that responses exceeding their budget are stopped"""
+        results = MockBudgetTablePlugin().call({"action": "generate"})
+        self.assertEqual(results.status.code, 1)
+        self.assertEqual(results.status.message,
+                         "Table response exceeds 5 rows")
+        results = MockTruncatedTablePlugin().call({"action": "generate"})
+        self.assertEqual(results.status.code, 0)
+        self.assertEqual(results.status.message,
+                         "Partial results, table response exceeds 30 bytes")
+        self.assertEqual(results.response,
+                         [{"foo": str(i)} for i in range(7)])
+
+
+    def test_fanout_budget(self):
+        """Tests that the budget applies to the merged fan-out response"""
+        context = json.dumps({"constraints": [{
+            "name": "host",
+            "affinity": "TEXT",
+            "list": [{"op": osquery.EQUALS, "expr": host}
+                     for host in ("a", "b", "c")],
+        }]})
+        plugin = MockFanoutTablePlugin()
+        try:
+            plugin.max_rows = 2
+            results = plugin.call({"action": "generate", "context": context})
+            self.assertEqual(results.status.code, 1)
+            self.assertEqual(results.status.message,
+                             "Table response exceeds 2 rows")
+            plugin.truncate_results = True
+            results = plugin.call({"action": "generate", "context": context})
+            self.assertEqual(results.status.code, 0)
+            self.assertEqual(len(results.response), 2)
+        finally:
+            del plugin.max_rows
+            del plugin.truncate_results
+
+    def test_budget_keeps_generated_list(self):
+        """Tests that truncating leaves the generated list alone"""
+        expected = [dict(row) for row in PERSISTENT_ROWS]
+        plugin = MockPersistentTablePlugin()
+        try:
+            plugin.max_rows = 1
+            plugin.truncate_results = True
+            results = plugin.call({"action": "generate"})
+            self.assertEqual(results.response, [{"a": "1", "b": "x"}])
+        finally:
+            del plugin.max_rows
+            del plugin.truncate_results
+        self.assertEqual(PERSISTENT_ROWS, expected)
+
 if __name__ == '__main__':
     unittest.main()
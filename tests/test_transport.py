@@ -0,0 +1,77 @@
+"""This source code is licensed under the BSD-style license found in the
+LICENSE file in the root directory of this source tree. An additional grant
+of patent rights can be found in the PATENTS file in the same directory.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import socket
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                "../build/lib/")))
+
+from thrift.transport import TSocket
+
+from osquery.extensions.ttypes import ExtensionResponse, ExtensionStatus
+from osquery.protocol import binary_protocol
+from osquery.transport import TLargeBufferedTransport
+
+def transport_pair():
+    """Two connected large buffered transports"""
+    first, second = socket.socketpair()
+    transports = []
+    for handle in (first, second):
+        sock = TSocket.TSocket()
+        sock.handle = handle
+        transports.append(TLargeBufferedTransport(sock, rbuf_size=1024))
+    return transports
+
+@unittest.skipIf(not hasattr(socket, "socketpair") or
+                 sys.platform == "win32", "Requires UNIX sockets")
+class TestTransport(unittest.TestCase):
+    """Tests for osquery.transport"""
+
+    def test_large_and_small_writes(self):
+        """Tests that gathered writes arrive in order"""
+        writer, reader = transport_pair()
+        large = os.urandom(3 * 1024 * 1024)
+        sender = threading.Thread(target=lambda: (
+            writer.write(b"head"), writer.write(large), writer.write(b"tail"),
+            writer.flush()))
+        sender.start()
+        self.assertEqual(reader.readAll(4), b"head")
+        self.assertEqual(reader.readAll(len(large)), large)
+        self.assertEqual(reader.readAll(4), b"tail")
+        sender.join()
+        writer.close()
+        reader.close()
+
+    def test_response_round_trip(self):
+        """Tests that a large response is encoded and decoded"""
+        writer, reader = transport_pair()
+        response = ExtensionResponse(
+            status=ExtensionStatus(code=0, message="OK"),
+            response=[{"path": "/usr/bin/%d" % i, "size": str(i)}
+                      for i in range(50000)])
+
+        def send():
+            response.write(binary_protocol(writer))
+            writer.flush()
+        sender = threading.Thread(target=send)
+        sender.start()
+        decoded = ExtensionResponse()
+        decoded.read(binary_protocol(reader))
+        sender.join()
+        self.assertEqual(decoded, response)
+        writer.close()
+        reader.close()
+
+if __name__ == '__main__':
+    unittest.main()